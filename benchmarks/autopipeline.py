@@ -0,0 +1,58 @@
+"""
+Measure GET throughput with and without auto-pipelining.
+
+Every round issues ``--concurrency`` independent GETs within the same reactor
+iteration (as many request handlers would) and waits for all of them.
+
+    python benchmarks/autopipeline.py --requests 100000 --concurrency 1000
+"""
+import argparse
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+@defer.inlineCallbacks
+def run(autopipeline, options):
+    db = yield redis.connect(
+        options.host, options.port, poolsize=options.poolsize,
+        reconnect=False, autopipeline=autopipeline
+    )
+    yield db.set("trex:bench:autopipeline", "x" * options.size)
+
+    rounds = options.requests // options.concurrency
+    start = time.time()
+    for _ in xrange(rounds):
+        yield defer.gatherResults([
+            db.get("trex:bench:autopipeline")
+            for _ in xrange(options.concurrency)
+        ])
+    elapsed = time.time() - start
+
+    yield db.delete("trex:bench:autopipeline")
+    yield db.disconnect()
+    defer.returnValue(rounds * options.concurrency / elapsed)
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    for autopipeline in (False, True):
+        ops = yield run(autopipeline, options)
+        sys.stdout.write(
+            "autopipeline=%-5s poolsize=%d: %10.0f ops/sec\n" %
+            (autopipeline, options.poolsize, ops)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--poolsize", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=16)
+    task.react(main, [parser.parse_args()])
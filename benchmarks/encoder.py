@@ -0,0 +1,58 @@
+"""
+Compare the command encoder with the one execute_command used to inline.
+
+    python benchmarks/encoder.py --number 200000
+"""
+import argparse
+import sys
+import time
+import timeit
+
+from trex.encoding import encode_command
+
+
+def legacy_encode(args, charset="utf-8", errors="strict"):
+    cmds = []
+    cmd_template = "$%s\r\n%s\r\n"
+    for s in args:
+        if isinstance(s, str):
+            cmd = s
+        elif isinstance(s, unicode):
+            cmd = s.encode(charset, errors)
+        elif isinstance(s, float):
+            cmd = format(s, "f")
+        else:
+            cmd = str(s)
+        cmds.append(cmd_template % (len(cmd), cmd))
+    return "*%s\r\n%s" % (len(cmds), "".join(cmds))
+
+
+COMMANDS = [
+    ("GET", ("GET", "user:1000:name")),
+    ("SET", ("SET", "user:1000:name", "some value")),
+    ("INCRBY", ("INCRBY", "counter:requests", 1)),
+    ("HSET", ("HSET", "user:1000", u"email", u"someone@example.com")),
+    ("ZADD", ("ZADD", "leaderboard", 10.5, "player:1000")),
+]
+
+
+def main(options):
+    for label, args in COMMANDS:
+        assert "".join(encode_command(args)) == legacy_encode(args)
+        results = []
+        for encoder in (legacy_encode, encode_command):
+            # CPU time is far less noisy than wall clock time on shared hosts
+            timer = timeit.Timer(lambda: encoder(args), timer=time.clock)
+            best = min(timer.repeat(options.repeat, options.number))
+            results.append(best / options.number * 1e9)
+        sys.stdout.write(
+            "%-7s legacy %6.0f ns  encode_command %6.0f ns  (%.2fx)\n" %
+            (label, results[0], results[1], results[0] / results[1])
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--number", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=9)
+    main(parser.parse_args())
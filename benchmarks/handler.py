@@ -0,0 +1,61 @@
+"""
+Measure the per-call overhead of ConnectionHandler: the time it takes to
+issue a GET through the handler, compared with calling the protocol of the
+connection directly.
+
+Commands are auto-pipelined, so that issuing a round of ``--concurrency``
+GETs writes nothing until the round is over; only the time spent issuing
+them is counted.
+
+    python benchmarks/handler.py --requests 200000 --concurrency 1000
+"""
+import argparse
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+@defer.inlineCallbacks
+def run(get, options):
+    rounds = options.requests // options.concurrency
+    elapsed = 0.0
+    for _ in xrange(rounds):
+        start = time.time()
+        deferreds = [
+            get("trex:bench:handler") for _ in xrange(options.concurrency)
+        ]
+        elapsed += time.time() - start
+        yield defer.gatherResults(deferreds)
+    defer.returnValue(elapsed / (rounds * options.concurrency))
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    db = yield redis.connect(
+        options.host, options.port, reconnect=False, autopipeline=True
+    )
+    conn = db._factory.pool[0]
+    yield db.set("trex:bench:handler", "x")
+
+    for _ in xrange(options.repeat):
+        for name, get in (("handler", db.get), ("protocol", conn.get)):
+            per_call = yield run(get, options)
+            sys.stdout.write(
+                "%-8s: %6.2f usec/call\n" % (name, per_call * 1e6)
+            )
+
+    yield db.delete("trex:bench:handler")
+    yield db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    task.react(main, [parser.parse_args()])
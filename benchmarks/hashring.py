@@ -0,0 +1,45 @@
+"""
+Measure HashRing lookups per second, with the crc32 and the ketama point
+layouts. No redis server is needed.
+
+    python benchmarks/hashring.py --nodes 16 --keys 100000
+"""
+import argparse
+import sys
+import time
+
+from trex.connections import HashRing
+
+
+class Factory(object):
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+class Node(object):
+    def __init__(self, uuid):
+        self._factory = Factory(uuid)
+
+
+def main(options):
+    nodes = [Node("10.0.0.%d:6379" % x) for x in xrange(options.nodes)]
+    keys = ["trex:bench:hashring:%d" % x for x in xrange(options.keys)]
+    for ketama in (False, True):
+        ring = HashRing(nodes, ketama=ketama)
+        for _ in xrange(options.repeat):
+            start = time.time()
+            for key in keys:
+                ring(key)
+            elapsed = time.time() - start
+            sys.stdout.write(
+                "ketama=%-5s %d nodes: %10.0f lookups/sec\n" %
+                (ketama, options.nodes, options.keys / elapsed)
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--nodes", type=int, default=16)
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,56 @@
+"""
+Measure the time and peak memory needed to SET one large value.
+
+Run a single type per process, peak RSS is only ever growing:
+
+    python benchmarks/large_values.py --size 100 --type str
+    python benchmarks/large_values.py --size 100 --type bytearray
+"""
+import argparse
+import array
+import resource
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+TYPES = {
+    "str": lambda s: s,
+    "bytearray": bytearray,
+    "memoryview": lambda s: memoryview(bytearray(s)),
+    "array": lambda s: array.array("c", s),
+}
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    db = yield redis.connect(options.host, options.port, reconnect=False)
+    value = TYPES[options.type]("x" * (options.size * 1024 * 1024))
+    before = peak_rss()
+
+    start = time.time()
+    yield db.set("trex:bench:large_value", value)
+    elapsed = time.time() - start
+
+    sys.stdout.write(
+        "%-10s %d MB: %6.3f s, peak RSS +%.0f MB\n" %
+        (options.type, options.size, elapsed, peak_rss() - before)
+    )
+    yield db.delete("trex:bench:large_value")
+    yield db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--size", type=int, default=100, help="in MB")
+    parser.add_argument("--type", choices=sorted(TYPES), default="str")
+    task.react(main, [parser.parse_args()])
@@ -0,0 +1,55 @@
+"""
+Measure MGET throughput of binary values with and without reply decoding.
+
+    python benchmarks/mget.py --keys 100 --size 4096 --requests 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+@defer.inlineCallbacks
+def run(decodeResponses, keys, options):
+    db = yield redis.connect(
+        options.host, options.port, reconnect=False,
+        decodeResponses=decodeResponses
+    )
+    start = time.time()
+    for _ in xrange(options.requests):
+        yield db.mget(keys)
+    elapsed = time.time() - start
+    yield db.disconnect()
+    defer.returnValue(options.requests / elapsed)
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    keys = ["trex:bench:mget:%d" % x for x in xrange(options.keys)]
+    db = yield redis.connect(options.host, options.port, reconnect=False)
+    # random bytes, the worst case for the utf-8 decoding attempt
+    yield db.mset(dict((k, os.urandom(options.size)) for k in keys))
+
+    for decodeResponses in (True, False):
+        ops = yield run(decodeResponses, keys, options)
+        sys.stdout.write(
+            "decodeResponses=%-5s %d x %d bytes: %8.0f MGETs/sec\n" %
+            (decodeResponses, options.keys, options.size, ops)
+        )
+
+    yield db.delete(keys)
+    yield db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--requests", type=int, default=2000)
+    task.react(main, [parser.parse_args()])
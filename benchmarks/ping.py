@@ -0,0 +1,47 @@
+"""
+Flood one connection with PINGs and measure how many replies per second
+are dispatched to their callers.
+
+    python benchmarks/ping.py --requests 200000 --concurrency 1000
+"""
+import argparse
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    db = yield redis.connect(
+        options.host, options.port, reconnect=False, autopipeline=True
+    )
+    conn = db._factory.pool[0]
+    rounds = options.requests // options.concurrency
+
+    for _ in xrange(options.repeat):
+        start = time.time()
+        for _ in xrange(rounds):
+            yield defer.gatherResults(
+                [conn.ping() for _ in xrange(options.concurrency)]
+            )
+        elapsed = time.time() - start
+        sys.stdout.write(
+            "%d PINGs, %d in flight: %8.0f replies/sec\n" %
+            (rounds * options.concurrency, options.concurrency,
+             rounds * options.concurrency / elapsed)
+        )
+
+    yield db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    task.react(main, [parser.parse_args()])
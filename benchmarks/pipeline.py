@@ -0,0 +1,67 @@
+"""
+Measure the client side cost of large explicit pipelines, and of the same
+commands sent with stream_pipeline().
+
+    python benchmarks/pipeline.py --commands 10000 --repeat 20
+"""
+import argparse
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    db = yield redis.connect(options.host, options.port, reconnect=False)
+    key = "trex:bench:pipeline"
+    yield db.set(key, "x" * options.size)
+
+    for name, command in (("SET", "set"), ("GET", "get")):
+        best = None
+        for _ in xrange(options.repeat):
+            start = time.time()
+            pipeline = yield db.pipeline()
+            f = getattr(pipeline, command)
+            if command == "set":
+                for _ in xrange(options.commands):
+                    f(key, "x" * options.size)
+            else:
+                for _ in xrange(options.commands):
+                    f(key)
+            yield pipeline.execute_pipeline()
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        sys.stdout.write(
+            "%d pipelined %ss: best %6.1f ms (%8.0f commands/sec)\n" %
+            (options.commands, name, best * 1000, options.commands / best)
+        )
+
+    best = None
+    for _ in xrange(options.repeat):
+        start = time.time()
+        yield db.stream_pipeline(
+            ("SET", key, "x" * options.size)
+            for _ in xrange(options.commands)
+        )
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    sys.stdout.write(
+        "%d streamed SETs: best %6.1f ms (%8.0f commands/sec)\n" %
+        (options.commands, best * 1000, options.commands / best)
+    )
+
+    yield db.delete(key)
+    yield db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--commands", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=20)
+    task.react(main, [parser.parse_args()])
@@ -0,0 +1,57 @@
+"""
+Compare the shard placement algorithms: lookups per second, and how evenly
+a sample of keys is spread, as the coefficient of variation of the number
+of keys per shard. No redis server is needed.
+
+    python benchmarks/placement.py --keys 100000
+"""
+import argparse
+import math
+import sys
+import time
+
+from trex.connections import PLACEMENTS
+
+
+class Factory(object):
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+class Node(object):
+    def __init__(self, uuid):
+        self._factory = Factory(uuid)
+
+
+def run(placement, shards, keys):
+    nodes = [Node("10.0.%d.%d:6379" % divmod(x, 256)) for x in xrange(shards)]
+    p = placement(nodes)
+    counts = dict((node, 0) for node in nodes)
+    start = time.time()
+    for key in keys:
+        counts[p(key)] += 1
+    elapsed = time.time() - start
+
+    mean = float(len(keys)) / shards
+    variance = sum((c - mean) ** 2 for c in counts.values()) / shards
+    return len(keys) / elapsed, math.sqrt(variance) / mean
+
+
+def main(options):
+    keys = ["trex:bench:placement:%d" % x for x in xrange(options.keys)]
+    for shards in options.shards:
+        for name in sorted(PLACEMENTS):
+            ops, cv = run(PLACEMENTS[name], shards, keys)
+            sys.stdout.write(
+                "%-10s %3d shards: %10.0f lookups/sec, cv %.4f\n" %
+                (name, shards, ops, cv)
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument(
+        "--shards", type=int, nargs="+", default=[4, 16, 64, 256]
+    )
+    main(parser.parse_args())
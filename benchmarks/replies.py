@@ -0,0 +1,53 @@
+"""
+Measure the throughput of commands with large multi-bulk replies of text.
+
+    python benchmarks/replies.py --elements 1000 --requests 500
+"""
+import argparse
+import sys
+import time
+
+from twisted.internet import defer, task
+
+from trex import redis
+
+
+KEY = "trex:bench:replies"
+
+
+@defer.inlineCallbacks
+def main(reactor, options):
+    db = yield redis.connect(options.host, options.port, reconnect=False)
+    values = [u"value-\xe9-%d" % x for x in xrange(options.elements)]
+    yield db.rpush(KEY + ":list", values)
+    yield db.sadd(KEY + ":set", values)
+    yield db.hmset(KEY + ":hash", dict(
+        (u"field-%d" % x, v) for x, v in enumerate(values)
+    ))
+
+    commands = [
+        ("LRANGE", lambda: db.lrange(KEY + ":list", 0, -1)),
+        ("SMEMBERS", lambda: db.smembers(KEY + ":set")),
+        ("HGETALL", lambda: db.hgetall(KEY + ":hash")),
+    ]
+    for name, f in commands:
+        start = time.time()
+        for _ in xrange(options.requests):
+            yield f()
+        elapsed = time.time() - start
+        sys.stdout.write(
+            "%-8s %d elements: %8.0f replies/sec\n" %
+            (name, options.elements, options.requests / elapsed)
+        )
+
+    yield db.delete([KEY + ":list", KEY + ":set", KEY + ":hash"])
+    yield db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--elements", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    task.react(main, [parser.parse_args()])
@@ -0,0 +1,62 @@
+"""
+Report the expected versus actual share of keys of each shard, for a given
+set of weighted shards and a sample of keys. No redis server is needed.
+
+    python benchmarks/shard_distribution.py 10.0.0.1:6379=4 10.0.0.2:6379=1
+
+Keys are read one per line from --keys-from, or generated as
+"<prefix><n>" otherwise.
+"""
+import argparse
+import sys
+
+from trex.connections import HashRing
+
+
+class Factory(object):
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+class Node(object):
+    def __init__(self, uuid):
+        self._factory = Factory(uuid)
+
+
+def parse_shard(shard):
+    uri, _, weight = shard.partition("=")
+    return uri, float(weight) if weight else 1
+
+
+def main(options):
+    shards = [parse_shard(s) for s in options.shards]
+    ring = HashRing(
+        [Node(uri) for uri, weight in shards], ketama=options.ketama,
+        weights=[weight for uri, weight in shards]
+    )
+    if options.keys_from:
+        keys = (line.rstrip("\n") for line in open(options.keys_from))
+    else:
+        keys = ("%s%d" % (options.prefix, x) for x in xrange(options.keys))
+
+    sys.stdout.write("%-24s %9s %9s %9s\n" % (
+        "shard", "expected", "actual", "error"
+    ))
+    for node, expected, actual in ring.distribution(keys):
+        sys.stdout.write("%-24s %8.2f%% %8.2f%% %+8.2f%%\n" % (
+            node._factory.uuid, expected * 100, actual * 100,
+            (actual - expected) * 100
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("shards", nargs="+", metavar="URI[=WEIGHT]")
+    parser.add_argument("--keys", type=int, default=100000)
+    parser.add_argument("--prefix", default="trex:key:")
+    parser.add_argument("--keys-from", metavar="FILE")
+    parser.add_argument("--ketama", action="store_true")
+    main(parser.parse_args())
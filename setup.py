@@ -22,7 +22,7 @@ setup(
     keywords=["twisted", "redis"],
     install_requires=[
         'twisted',
-        'hiredis',
+        'hiredis>=1.0',
     ],
     extras_require={
         'dev': ['ipdb', 'mock', 'tox', 'coverage'],
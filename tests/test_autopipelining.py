@@ -0,0 +1,90 @@
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from trex import redis
+from trex.exceptions import ResponseError
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+class CountingTransport(object):
+
+    def __init__(self, transport):
+        self.original_transport = transport
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+        return self.original_transport.write(data)
+
+    def writeSequence(self, data):
+        self.writes.append("".join(data))
+        return self.original_transport.writeSequence(data)
+
+    def __getattr__(self, attr):
+        return getattr(self.original_transport, attr)
+
+
+class TestAutoPipelining(unittest.TestCase):
+    KEYS = ["trex:test_autopipeline:%d" % x for x in range(100)]
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, reconnect=False, autopipeline=True
+        )
+        self.conn = self.db._factory.pool[0]
+        self.conn.transport = CountingTransport(self.conn.transport)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEYS)
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_commands_in_one_iteration_share_a_write(self):
+        yield defer.gatherResults(
+            [self.db.set(k, i) for i, k in enumerate(self.KEYS)]
+        )
+        self.assertEqual(len(self.conn.transport.writes), 1)
+
+        values = yield defer.gatherResults([self.db.get(k) for k in self.KEYS])
+        self.assertEqual(values, range(100))
+        self.assertEqual(len(self.conn.transport.writes), 2)
+
+    @defer.inlineCallbacks
+    def test_byte_threshold_flushes_early(self):
+        self.conn.AUTOPIPELINE_MAX_BYTES = 200
+        yield defer.gatherResults(
+            [self.db.set(k, "x" * 100) for k in self.KEYS[:10]]
+        )
+        self.assertTrue(len(self.conn.transport.writes) > 1)
+        for data in self.conn.transport.writes[:-1]:
+            self.assertTrue(len(data) >= 200)
+
+    @defer.inlineCallbacks
+    def test_errors_are_delivered_to_their_caller(self):
+        yield self.db.set(self.KEYS[0], "foo")
+        d1 = self.db.incr(self.KEYS[0])
+        d2 = self.db.get(self.KEYS[0])
+        yield self.assertFailure(d1, ResponseError)
+        result = yield d2
+        self.assertEqual(result, "foo")
+
+    @defer.inlineCallbacks
+    def test_explicit_pipeline_keeps_order(self):
+        d = self.db.set(self.KEYS[0], "before")
+        pipeline = yield self.db.pipeline()
+        pipeline.get(self.KEYS[0])
+        pipeline.set(self.KEYS[0], "after")
+        results = yield pipeline.execute_pipeline()
+        yield d
+        self.assertEqual(results, ["before", "OK"])
+
+    @defer.inlineCallbacks
+    def test_transaction(self):
+        t = yield self.db.multi()
+        yield t.set(self.KEYS[0], "foo")
+        yield t.get(self.KEYS[0])
+        r = yield t.commit()
+        self.assertEqual(r, ["OK", "foo"])
@@ -1,7 +1,8 @@
-from twisted.internet import defer
+from twisted.internet import defer, reactor, task
 from twisted.trial import unittest
 
 from trex import redis
+from trex.exceptions import ConnectionError
 
 from .mixins import REDIS_HOST, REDIS_PORT
 
@@ -30,3 +31,45 @@ class TestBlockingCommands(unittest.TestCase):
 
         yield db.delete(self.QUEUE_KEY, self.TEST_KEY)
         yield db.disconnect()
+
+    @defer.inlineCallbacks
+    def testBlockingPool(self):
+        db = yield redis.connect(REDIS_HOST, REDIS_PORT, poolsize=1,
+                                 reconnect=False, blockingPoolsize=2)
+        yield db.delete(self.QUEUE_KEY, self.TEST_KEY)
+
+        # Block both connections of the blocking pool.
+        d1 = db.brpop(self.QUEUE_KEY, timeout=0)
+        d2 = db.blpop(self.QUEUE_KEY, timeout=0)
+        # The only connection of the main pool is still available.
+        yield db.set(self.TEST_KEY, 'somevalue')
+        result = yield db.get(self.TEST_KEY)
+        self.assertEqual(result, 'somevalue')
+
+        yield db.lpush(self.QUEUE_KEY, self.QUEUE_VALUE)
+        yield db.lpush(self.QUEUE_KEY, self.QUEUE_VALUE)
+        results = yield defer.gatherResults([d1, d2])
+        self.assertEqual(
+            results, [[self.QUEUE_KEY, self.QUEUE_VALUE]] * 2
+        )
+        factory = db._factory
+        self.assertEqual(factory.size, 1)
+        self.assertEqual(factory.blockingFactory.size, 2)
+
+        yield db.delete(self.QUEUE_KEY, self.TEST_KEY)
+        yield db.disconnect()
+        self.assertEqual(factory.blockingFactory.size, 0)
+
+    @defer.inlineCallbacks
+    def testDisconnectWhileWaiting(self):
+        db = yield redis.connect(REDIS_HOST, REDIS_PORT, poolsize=1,
+                                 reconnect=False, blockingPoolsize=2)
+        d = db.blpop(self.QUEUE_KEY, timeout=0)
+        blocking = db._factory.blockingFactory
+        self.assertEqual(blocking.waiters, 1)
+        yield db.disconnect()
+        yield self.assertFailure(d, ConnectionError)
+        yield task.deferLater(reactor, 0.3, lambda: None)
+        self.assertEqual(blocking.size, 0)
+        self.assertEqual(blocking.connectors, set())
+        yield self.assertFailure(db.blpop(self.QUEUE_KEY), ConnectionError)
@@ -16,6 +16,18 @@ class TestConnectionMethods(unittest.TestCase):
         self.assertEqual(isinstance(db, redis.ConnectionHandler), True)
         yield db.disconnect()
 
+    @defer.inlineCallbacks
+    def test_cached_wrappers(self):
+        db = yield redis.Connection(REDIS_HOST, REDIS_PORT, reconnect=False)
+        get = db.get
+        self.assertIs(db.get, get)
+        self.assertIsNot(db.set, get)
+        yield db.set("trex:test_cached_wrappers", "foo")
+        result = yield get("trex:test_cached_wrappers")
+        self.assertEqual(result, "foo")
+        yield db.delete("trex:test_cached_wrappers")
+        yield db.disconnect()
+
     @defer.inlineCallbacks
     def test_ConnectionDB1(self):
         db = yield redis.Connection(REDIS_HOST, REDIS_PORT, dbid=1,
@@ -0,0 +1,208 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from trex import redis
+from trex.decoding import AUTO, FLOAT, INTEGER, RAW, TEXT, pairs, scan
+from trex.exceptions import InvalidData
+from trex.protocols import RedisProtocol
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+class TestDecoders(unittest.TestCase):
+    def test_auto(self):
+        self.assertEqual(
+            AUTO(["1", "1.5", "-2", "foo", "caf\xc3\xa9", None, 3], "utf-8"),
+            [1, 1.5, -2, u"foo", u"caf\xe9", None, 3]
+        )
+        self.assertEqual(AUTO("caf\xe9", "utf-8"), "caf\xe9")
+        self.assertEqual(AUTO("foo", None), "foo")
+
+    def test_typed(self):
+        self.assertEqual(TEXT(["1", "foo"], "utf-8"), [u"1", u"foo"])
+        self.assertEqual(INTEGER(["1", 2, None], "utf-8"), [1, 2, None])
+        self.assertEqual(FLOAT("1", "utf-8"), 1.0)
+        self.assertEqual(FLOAT("-inf", "utf-8"), float("-inf"))
+        blob = ["1", "\xff\x00"]
+        self.assertIs(RAW(blob, "utf-8"), blob)
+
+    def test_pairs(self):
+        self.assertEqual(
+            pairs(TEXT, FLOAT)(["1", "2", "b", "3.5"], "utf-8"),
+            [u"1", 2.0, u"b", 3.5]
+        )
+
+    def test_scan(self):
+        self.assertEqual(
+            scan()(["17", ["1", "foo"]], "utf-8"), [17, ["1", "foo"]]
+        )
+
+
+class TestReaderFallback(unittest.TestCase):
+    def test_reply_across_reads(self):
+        # a reply which takes two reads does not mix up the strings that
+        # could not be decoded with those of another connection
+        p1, p2 = RedisProtocol(), RedisProtocol()
+        d1, d2 = p1.replyQueue.get(), p2.replyQueue.get()
+        p1.dataReceived("*2\r\n$1\r\n\xff\r\n")
+        p2.dataReceived("$1\r\n\xfe\r\n")
+        self.assertEqual(self.successResultOf(d2), "\xfe")
+        self.assertNoResult(d1)
+        p1.dataReceived("$1\r\n\xfd\r\n")
+        self.assertEqual(self.successResultOf(d1), ["\xff", "\xfd"])
+
+    def test_replacement_character(self):
+        p = RedisProtocol()
+        d = p.replyQueue.get()
+        p.dataReceived("*2\r\n$3\r\n\xef\xbf\xbd\r\n$1\r\n\xff\r\n")
+        self.assertEqual(self.successResultOf(d), [u"\ufffd", "\xff"])
+
+
+class TestTypedReplies(unittest.TestCase):
+    KEY = "trex:test_decoding"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.Connection(
+            REDIS_HOST, REDIS_PORT, reconnect=False
+        )
+        yield self.db.delete(self.KEY, "12345")
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEY, "12345")
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_key_names_are_text(self):
+        yield self.db.set("12345", "foo")
+        keys = yield self.db.keys("12345")
+        self.assertEqual(keys, [u"12345"])
+
+    @defer.inlineCallbacks
+    def test_hash_fields_are_text(self):
+        yield self.db.hmset(self.KEY, {"1": "2", "foo": "bar"})
+        result = yield self.db.hgetall(self.KEY)
+        self.assertEqual(result, {u"1": 2, u"foo": u"bar"})
+        fields = yield self.db.hkeys(self.KEY)
+        self.assertEqual(sorted(fields), [u"1", u"foo"])
+
+    @defer.inlineCallbacks
+    def test_scores_are_floats(self):
+        yield self.db.zadd(self.KEY, 1, "1")
+        score = yield self.db.zscore(self.KEY, "1")
+        self.assertIsInstance(score, float)
+        result = yield self.db.zrange(self.KEY, withscores=True)
+        self.assertEqual(result, [(1, 1.0)])
+        self.assertIsInstance(result[0][1], float)
+
+    @defer.inlineCallbacks
+    def test_transaction(self):
+        t = yield self.db.multi()
+        yield t.zadd(self.KEY, 2, "foo")
+        yield t.zscore(self.KEY, "foo")
+        yield t.keys(self.KEY)
+        r = yield t.commit()
+        self.assertEqual(r, [1, 2.0, [self.KEY]])
+        self.assertIsInstance(r[1], float)
+
+    @defer.inlineCallbacks
+    def test_undecodable_strings_stay_bytes(self):
+        values = ["\xff", u"caf\xe9", "\xff", "\xff\xfe", "12", "\xff"]
+        yield self.db.rpush(self.KEY, values)
+        result = yield self.db.lrange(self.KEY, 0, -1)
+        self.assertEqual(
+            result, ["\xff", u"caf\xe9", "\xff", "\xff\xfe", 12, "\xff"]
+        )
+        self.assertEqual(
+            [type(x) for x in result], [str, unicode, str, str, int, str]
+        )
+        result = yield self.db.get(self.KEY + ":missing")
+        self.assertEqual(result, None)
+
+    @defer.inlineCallbacks
+    def test_reader_decoding(self):
+        yield self.db.hmset(self.KEY, {"f\xc3\xa9": "1.5", "\xff": "\xfe"})
+        conn = self.db._factory.pool[0]
+        result = yield self.db.hgetall(self.KEY)
+        self.assertTrue(conn._readerDecodes)
+        self.assertEqual(result, {u"f\xe9": 1.5, "\xff": "\xfe"})
+        result = yield self.db.hgetall(self.KEY, decodeResponses=False)
+        self.assertFalse(conn._readerDecodes)
+        self.assertEqual(result, {"f\xc3\xa9": "1.5", "\xff": "\xfe"})
+
+    @defer.inlineCallbacks
+    def test_per_call_decoder(self):
+        yield self.db.set("12345", "12")
+        yield self.db.rpush(self.KEY, ["1", "\xff"])
+        result = yield self.db.get("12345", decoder=RAW)
+        self.assertEqual(result, "12")
+        result = yield self.db.mget(["12345"], decoder=TEXT)
+        self.assertEqual(result, [u"12"])
+        result = yield self.db.lrange(self.KEY, 0, -1, decoder=RAW)
+        self.assertEqual(result, ["1", "\xff"])
+        self.assertEqual([type(x) for x in result], [str, str])
+        # the default is still AUTO
+        result = yield self.db.lrange(self.KEY, 0, -1)
+        self.assertEqual(result, [1, "\xff"])
+
+    @defer.inlineCallbacks
+    def test_decoding_errors(self):
+        yield self.db.set(self.KEY, "foo")
+        conn = self.db._factory.pool[0]
+        d = conn.execute_command("GET", self.KEY, decoder=INTEGER)
+        yield self.assertFailure(d, InvalidData)
+        # the following replies still reach their callers
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, u"foo")
+
+
+class TestRawReplies(unittest.TestCase):
+    KEYS = ["trex:test_raw:%d" % x for x in range(3)]
+    BLOB = "\x1f\x8b\x08\x00\xff\xfe"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, reconnect=False, decodeResponses=False
+        )
+        yield self.db.mset(dict(zip(self.KEYS, ["1", "foo", self.BLOB])))
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEYS)
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_replies_are_untouched(self):
+        result = yield self.db.mget(self.KEYS)
+        self.assertEqual(result, ["1", "foo", self.BLOB])
+        self.assertEqual([type(x) for x in result], [str] * 3)
+        result = yield self.db.keys(self.KEYS[0])
+        self.assertEqual(result, [self.KEYS[0]])
+        self.assertIsInstance(result[0], str)
+        # integer replies are parsed by hiredis
+        result = yield self.db.incr(self.KEYS[0])
+        self.assertEqual(result, 2)
+
+    @defer.inlineCallbacks
+    def test_per_call(self):
+        result = yield self.db.mget(self.KEYS[:2], decodeResponses=True)
+        self.assertEqual(result, [1, u"foo"])
+        result = yield self.db.get(self.KEYS[1])
+        self.assertIsInstance(result, str)
+
+        db = yield redis.connect(REDIS_HOST, REDIS_PORT, reconnect=False)
+        self.addCleanup(db.disconnect)
+        result = yield db.get(self.KEYS[0], decodeResponses=False)
+        self.assertEqual(result, "1")
+        result = yield db.get(self.KEYS[0])
+        self.assertEqual(result, 1)
+
+    @defer.inlineCallbacks
+    def test_transaction(self):
+        t = yield self.db.multi()
+        yield t.get(self.KEYS[2])
+        yield t.zscore(self.KEYS[1] + ":z", "foo")
+        r = yield t.commit()
+        self.assertEqual(r, [self.BLOB, None])
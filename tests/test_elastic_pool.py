@@ -0,0 +1,77 @@
+from twisted.trial import unittest
+from twisted.internet import defer, reactor, task
+
+from trex import redis
+from trex.factories import RedisFactory
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+def sleep(secs):
+    return task.deferLater(reactor, secs, lambda: None)
+
+
+class TestElasticPool(unittest.TestCase):
+    KEYS = ["trex:test_elastic:%d" % x for x in range(3)]
+
+    def test_invalid_sizes(self):
+        self.assertRaises(ValueError, RedisFactory, None, None, 1, maxsize=0)
+        self.assertRaises(
+            ValueError, RedisFactory, None, None, 1, minsize=4, maxsize=2
+        )
+        factory = RedisFactory(None, None, 1, minsize=2, maxsize=4)
+        self.assertEqual(factory.poolsize, 2)
+        factory = RedisFactory(None, None, 8, maxsize=4)
+        self.assertEqual(factory.poolsize, 4)
+
+    @defer.inlineCallbacks
+    def test_grows_under_contention(self):
+        db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=1, maxsize=3, reconnect=False
+        )
+        factory = db._factory
+        self.assertEqual(factory.size, 1)
+        ds = [db.brpop(k, timeout=1) for k in self.KEYS]
+        self.assertEqual(factory.waiters, 2)
+        results = yield defer.gatherResults(ds)
+        self.assertEqual(results, [None] * 3)
+        self.assertEqual(factory.size, 3)
+        self.assertEqual(factory.waiters, 0)
+        yield db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_never_grows_past_maxsize(self):
+        db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=1, maxsize=2, reconnect=False
+        )
+        ds = [db.brpop(k, timeout=1) for k in self.KEYS]
+        yield defer.gatherResults(ds)
+        self.assertEqual(db._factory.size, 2)
+        yield db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_shrinks_when_idle(self):
+        db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=3, minsize=1, idleTimeout=0.2,
+            reconnect=False
+        )
+        factory = db._factory
+        self.assertEqual(factory.size, 3)
+        yield sleep(0.5)
+        self.assertEqual(factory.size, 1)
+        self.assertEqual(len(factory.connectors), 1)
+        result = yield db.ping()
+        self.assertEqual(result, "PONG")
+        yield db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_disconnect_while_growing(self):
+        db = yield redis.connect(REDIS_HOST, REDIS_PORT, poolsize=1, maxsize=4)
+        factory = db._factory
+        factory._grow()
+        self.assertEqual(len(factory.connectors), 2)
+        yield db.disconnect()
+        self.assertEqual(factory.size, 0)
+        yield sleep(0.3)
+        self.assertEqual(factory.size, 0)
+        self.assertEqual(factory.connectors, set())
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import array
+
+from trex.encoding import (
+    encode_arg, encode_command, SEGMENT_MIN, SMALL_INT_MAX
+)
+from trex.exceptions import InvalidData
+from trex import redis
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+class TestEncoding(unittest.TestCase):
+    def test_command(self):
+        self.assertEqual(
+            encode_command(("SET", "foo", "bar")),
+            ["*3\r\n$3\r\nSET\r\n$3\r\nfoo\r\n$3\r\nbar\r\n"]
+        )
+
+    def test_unknown_command_name(self):
+        self.assertEqual(
+            encode_command(("OBJECT", "encoding", "foo")),
+            ["*3\r\n$6\r\nOBJECT\r\n$8\r\nencoding\r\n$3\r\nfoo\r\n"]
+        )
+        self.assertEqual(
+            encode_command((u"GET", u"foo")),
+            ["*2\r\n$3\r\nGET\r\n$3\r\nfoo\r\n"]
+        )
+
+    def test_long_command(self):
+        args = ["DEL"] + ["k%d" % x for x in range(100)]
+        [encoded] = encode_command(args)
+        self.assertTrue(encoded.startswith("*101\r\n$3\r\nDEL\r\n"))
+        self.assertTrue(encoded.endswith("$3\r\nk99\r\n"))
+
+    def test_integers(self):
+        for value in (-10, -1, 0, 7, SMALL_INT_MAX - 1, SMALL_INT_MAX,
+                      2 ** 70):
+            s = str(value)
+            self.assertEqual(encode_arg(value), "$%d\r\n%s\r\n" % (len(s), s))
+
+    def test_other_types(self):
+        self.assertEqual(encode_arg(True), "$4\r\nTrue\r\n")
+        self.assertEqual(encode_arg(0.5), "$8\r\n0.500000\r\n")
+        self.assertEqual(encode_arg(u"caf\xe9"), "$5\r\ncaf\xc3\xa9\r\n")
+        self.assertEqual(
+            encode_arg(u"caf\xe9", "latin-1"), "$4\r\ncaf\xe9\r\n"
+        )
+
+    def test_unicode_errors(self):
+        self.assertRaises(InvalidData, encode_arg, u"caf\xe9", None)
+        self.assertRaises(InvalidData, encode_arg, u"caf\xe9", "ascii")
+
+    def test_large_values_are_not_copied(self):
+        value = "x" * SEGMENT_MIN
+        segments = encode_command(("RPUSH", "foo", value, "bar", value))
+        self.assertEqual(segments, [
+            "*5\r\n$5\r\nRPUSH\r\n$3\r\nfoo\r\n$%d\r\n" % SEGMENT_MIN,
+            value,
+            "\r\n$3\r\nbar\r\n$%d\r\n" % SEGMENT_MIN,
+            value,
+            "\r\n",
+        ])
+        self.assertIs(segments[1], value)
+
+    def test_buffer_types(self):
+        for value in (bytearray("bar"), buffer("bar"),
+                      memoryview(bytearray("bar")), array.array("c", "bar")):
+            self.assertEqual(
+                encode_command(("SET", "foo", value)),
+                ["*3\r\n$3\r\nSET\r\n$3\r\nfoo\r\n$3\r\nbar\r\n"]
+            )
+            self.assertEqual(encode_arg(value), "$3\r\nbar\r\n")
+        # the length is in bytes, not items
+        value = array.array("H", [0x6261, 0x7261])
+        self.assertEqual(
+            "".join(encode_command(("SET", "foo", value))),
+            "*3\r\n$3\r\nSET\r\n$3\r\nfoo\r\n$4\r\nabar\r\n"
+        )
+
+
+class TestLargeValues(unittest.TestCase):
+    KEY = "trex:test_large_values"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.connect(REDIS_HOST, REDIS_PORT, reconnect=False)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEY)
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_roundtrip(self):
+        value = "".join(chr(x % 256) for x in xrange(SEGMENT_MIN * 4))
+        for v in (value, bytearray(value), memoryview(bytearray(value))):
+            yield self.db.delete(self.KEY)
+            yield self.db.set(self.KEY, v)
+            result = yield self.db.get(self.KEY)
+            self.assertEqual(result, value)
+
+    @defer.inlineCallbacks
+    def test_pipeline(self):
+        value = "x" * SEGMENT_MIN
+        pipeline = yield self.db.pipeline()
+        pipeline.rpush(self.KEY, value)
+        pipeline.rpush(self.KEY, bytearray(value))
+        pipeline.lrange(self.KEY, 0, -1)
+        results = yield pipeline.execute_pipeline()
+        self.assertEqual(results, [1, 2, [value, value]])
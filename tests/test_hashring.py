@@ -0,0 +1,146 @@
+from twisted.trial import unittest
+
+from trex.connections import (
+    HashRing, JumpHash, RendezvousHash, get_placement
+)
+
+
+class FakeFactory(object):
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+class FakeNode(object):
+    def __init__(self, uuid):
+        self._factory = FakeFactory(uuid)
+
+
+class TestHashRing(unittest.TestCase):
+    KEYS = ["trex:test_hashring:%d" % x for x in xrange(2000)]
+
+    def setUp(self):
+        self.nodes = [FakeNode("10.0.0.%d:6379" % x) for x in xrange(4)]
+
+    def test_points(self):
+        ring = HashRing(self.nodes, replicas=10)
+        self.assertEqual(len(ring.points), 40)
+        self.assertEqual(list(ring.points), sorted(ring.points))
+        self.assertEqual(
+            sorted(ring.owners.tolist()), sorted(range(4) * 10)
+        )
+
+    def test_empty(self):
+        ring = HashRing()
+        self.assertEqual(ring.get_node("foo"), None)
+
+    def test_remove_node(self):
+        ring = HashRing(self.nodes)
+        before = dict((k, ring(k)) for k in self.KEYS)
+        ring.remove_node(self.nodes[1])
+        self.assertEqual(ring.nodes, self.nodes[:1] + self.nodes[2:])
+        for k in self.KEYS:
+            node = ring(k)
+            self.assertIsNot(node, self.nodes[1])
+            # keys only move off the removed node
+            if before[k] is not self.nodes[1]:
+                self.assertIs(node, before[k])
+        fresh = HashRing(self.nodes[:1] + self.nodes[2:])
+        self.assertEqual(ring.points, fresh.points)
+        self.assertEqual(ring.owners, fresh.owners)
+
+    def test_add_node(self):
+        ring = HashRing(self.nodes[:3])
+        before = dict((k, ring(k)) for k in self.KEYS)
+        ring.add_node(self.nodes[3])
+        for k in self.KEYS:
+            node = ring(k)
+            if node is not self.nodes[3]:
+                self.assertIs(node, before[k])
+
+    def test_set_weight(self):
+        ring = HashRing(self.nodes)
+        ring.set_weight(self.nodes[0], 3)
+        self.assertEqual(len(ring.points), 160 * 6)
+        counts = dict((node, 0) for node in self.nodes)
+        for k in self.KEYS:
+            counts[ring(k)] += 1
+        for node in self.nodes[1:]:
+            self.assertTrue(counts[self.nodes[0]] > counts[node])
+        ring.set_weight(self.nodes[0], 1)
+        self.assertEqual(ring.points, HashRing(self.nodes).points)
+
+    def test_ketama(self):
+        ring = HashRing(self.nodes, ketama=True)
+        # 40 MD5 digests of 4 points each per node
+        self.assertEqual(len(ring.points), 160 * 4)
+        self.assertEqual(ring.hash("foo"), 0xdb18bdac)
+        for k in self.KEYS:
+            self.assertIn(ring(k), self.nodes)
+
+    def test_weights(self):
+        ring = HashRing(self.nodes, weights=[4, 1, 1, 2])
+        self.assertEqual(len(ring.points), 160 * 8)
+        self.assertEqual(ring.weights, [4, 1, 1, 2])
+        shares = ring.distribution(self.KEYS)
+        self.assertEqual(
+            [expected for node, expected, actual in shares],
+            [0.5, 0.125, 0.125, 0.25]
+        )
+        self.assertApproximates(
+            sum(actual for node, expected, actual in shares), 1, 1e-9
+        )
+        for node, expected, actual in shares:
+            self.assertApproximates(actual, expected, 0.1)
+        self.assertRaises(ValueError, ring.add_node, FakeNode("x"), 0)
+
+
+class TestPlacements(unittest.TestCase):
+    KEYS = ["trex:test_placement:%d" % x for x in xrange(4000)]
+
+    def setUp(self):
+        self.nodes = [FakeNode("10.0.0.%d:6379" % x) for x in xrange(5)]
+
+    def test_get_placement(self):
+        self.assertIs(get_placement(None), HashRing)
+        self.assertIs(get_placement("JUMP"), JumpHash)
+        self.assertIs(get_placement("rendezvous"), RendezvousHash)
+        self.assertIs(get_placement(JumpHash), JumpHash)
+        self.assertTrue(get_placement("ketama")(self.nodes).ketama)
+        self.assertRaises(ValueError, get_placement, "modulo")
+        self.assertRaises(ValueError, get_placement, 42)
+
+    def _check_balance(self, placement):
+        weights = [1, 1, 2, 1, 1]
+        shares = placement(self.nodes, weights=weights).distribution(
+            self.KEYS
+        )
+        for node, expected, actual in shares:
+            self.assertApproximates(actual, expected, 0.03)
+
+    def _check_add_remove(self, placement):
+        p = placement(self.nodes[:4])
+        before = [p(k) for k in self.KEYS]
+        p.add_node(self.nodes[4])
+        after = [p(k) for k in self.KEYS]
+        # keys only move to the new node
+        for a, b in zip(before, after):
+            self.assertTrue(b is a or b is self.nodes[4])
+        self.assertTrue(after.count(self.nodes[4]) > 0)
+        p.remove_node(self.nodes[4])
+        self.assertEqual([p(k) for k in self.KEYS], before)
+
+    def test_jump(self):
+        self._check_balance(JumpHash)
+        self._check_add_remove(JumpHash)
+        self.assertEqual(JumpHash()("foo"), None)
+
+    def test_rendezvous(self):
+        self._check_balance(RendezvousHash)
+        self._check_add_remove(RendezvousHash)
+        self.assertEqual(RendezvousHash()("foo"), None)
+        # removing any node only moves its own keys
+        p = RendezvousHash(self.nodes)
+        before = [p(k) for k in self.KEYS]
+        p.remove_node(self.nodes[1])
+        for a, b in zip(before, [p(k) for k in self.KEYS]):
+            self.assertTrue(b is a or a is self.nodes[1])
@@ -0,0 +1,67 @@
+from twisted.trial import unittest
+from twisted.internet import defer, reactor, task
+
+from trex import redis
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+def sleep(secs):
+    return task.deferLater(reactor, secs, lambda: None)
+
+
+class HalfOpenTransport(object):
+    """
+    A transport whose writes never reach redis, like a connection whose
+    peer went away without a FIN.
+    """
+    def __init__(self, transport):
+        self.original_transport = transport
+
+    def write(self, data):
+        pass
+
+    def writeSequence(self, data):
+        pass
+
+    def __getattr__(self, attr):
+        return getattr(self.original_transport, attr)
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def test_idle_connections_are_pinged(self):
+        db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=2, heartbeatInterval=0.1,
+            reconnect=False
+        )
+        factory = db._factory
+        before = [conn.lastActivity for conn in factory.pool]
+        yield sleep(0.5)
+        after = [conn.lastActivity for conn in factory.pool]
+        self.assertTrue(all(a > b for a, b in zip(after, before)))
+        self.assertEqual(factory.heartbeatsMissed, 0)
+        self.assertEqual(factory.size, 2)
+        result = yield db.ping()
+        self.assertEqual(result, "PONG")
+        yield db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_half_open_connection_is_replaced(self):
+        db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=2, heartbeatInterval=0.1,
+            heartbeatTimeout=0.1
+        )
+        factory = db._factory
+        factory.delay = 0.01
+        dead = factory.pool[0]
+        dead.transport = HalfOpenTransport(dead.transport)
+        yield sleep(0.5)
+        self.assertEqual(factory.heartbeatsMissed, 1)
+        self.assertFalse(dead.connected)
+        self.assertNotIn(dead, factory.pool)
+        self.assertEqual(factory.size, 2)
+        result = yield db.ping()
+        self.assertEqual(result, "PONG")
+        yield db.disconnect()
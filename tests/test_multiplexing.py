@@ -0,0 +1,69 @@
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from trex import redis
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+class TestMultiplexedPool(unittest.TestCase):
+    KEY = "trex:test_multiplex"
+    QUEUE_KEY = "trex:test_multiplex_queue"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=2, reconnect=False,
+            multiplex=True
+        )
+        yield self.db.delete([self.KEY, self.QUEUE_KEY])
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete([self.KEY, self.QUEUE_KEY])
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_commands_share_connections(self):
+        ds = [self.db.incr(self.KEY) for _ in range(10)]
+        pool = self.db._factory.pool
+        self.assertEqual(sum(c.outstanding for c in pool), 10)
+        self.assertEqual([c.outstanding for c in pool], [5, 5])
+        # nothing has been checked out of the pool
+        self.assertEqual(len(self.db._factory.connectionQueue.pending), 2)
+        results = yield defer.gatherResults(ds)
+        self.assertEqual(sorted(results), range(1, 11))
+
+    @defer.inlineCallbacks
+    def test_blocking_pop_is_exclusive(self):
+        d = self.db.brpop(self.QUEUE_KEY, timeout=3)
+        for _ in range(5):
+            yield self.db.incr(self.KEY)
+        yield self.db.lpush(self.QUEUE_KEY, "value")
+        result = yield d
+        self.assertEqual(result, [self.QUEUE_KEY, "value"])
+
+    @defer.inlineCallbacks
+    def test_transaction_waits_for_outstanding_replies(self):
+        ds = [self.db.hgetall(self.KEY) for _ in range(4)]
+        t = yield self.db.multi()
+        self.assertTrue(t.inTransaction)
+        self.assertEqual(t.outstanding, 0)
+        yield t.set(self.KEY, "foo")
+        yield t.get(self.KEY)
+        r = yield t.commit()
+        self.assertEqual(r, ["OK", "foo"])
+        results = yield defer.gatherResults(ds)
+        self.assertEqual(results, [{}] * 4)
+
+    @defer.inlineCallbacks
+    def test_pipeline_is_not_shared(self):
+        pipeline = yield self.db.pipeline()
+        self.assertFalse(pipeline in self.db._factory.connectionQueue.pending)
+        pipeline.set(self.KEY, "foo")
+        yield self.db.set(self.KEY, "bar")
+        results = yield pipeline.execute_pipeline()
+        self.assertEqual(results, ["OK"])
+        self.assertTrue(pipeline in self.db._factory.connectionQueue.pending)
+        value = yield self.db.get(self.KEY)
+        self.assertEqual(value, "foo")
@@ -0,0 +1,84 @@
+from twisted.trial import unittest
+from twisted.internet import defer, reactor, task
+
+from trex import redis
+from trex.exceptions import ConnectionError
+from trex.factories import RedisFactory
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+def sleep(secs):
+    return task.deferLater(reactor, secs, lambda: None)
+
+
+class TestOfflineBuffer(unittest.TestCase):
+    KEY = "trex:test_offline"
+
+    @defer.inlineCallbacks
+    def _connect(self, **kwargs):
+        self.db = yield redis.connect(REDIS_HOST, REDIS_PORT, **kwargs)
+        self.addCleanup(self.db.disconnect)
+        yield self.db.set(self.KEY, 1)
+        self.addCleanup(self.db.delete, self.KEY)
+        self.factory = self.db._factory
+        self.factory.delay = 0.01
+
+    @defer.inlineCallbacks
+    def _goOffline(self):
+        self.factory.pool[0].transport.loseConnection()
+        while self.factory.size:
+            yield sleep(0.01)
+
+    @defer.inlineCallbacks
+    def _goOnline(self):
+        while not self.factory.size:
+            yield sleep(0.01)
+
+    def test_invalid_policy(self):
+        self.assertRaises(
+            ValueError, RedisFactory, None, None, 1, offlinePolicy="queue"
+        )
+
+    @defer.inlineCallbacks
+    def test_buffer(self):
+        yield self._connect(offlinePolicy="buffer")
+        conn = self.factory.pool[0]
+        yield self._goOffline()
+        d1 = self.db.incr(self.KEY)
+        d2 = self.db.get(self.KEY)
+        self.assertEqual(self.factory.offlineDepth, 2)
+        self.assertTrue(self.factory.offlineBytes > 0)
+        results = yield defer.gatherResults([d1, d2])
+        self.assertEqual(results, [2, 2])
+        self.assertEqual(self.factory.offlineDepth, 0)
+        self.assertEqual(self.factory.offlineBytes, 0)
+        self.assertNotEqual(self.factory.pool[0], conn)
+        result = yield self.db.ping()
+        self.assertEqual(result, "PONG")
+
+    @defer.inlineCallbacks
+    def test_fail(self):
+        yield self._connect(offlinePolicy="fail")
+        yield self._goOffline()
+        yield self.assertFailure(self.db.get(self.KEY), ConnectionError)
+        self.assertEqual(self.factory.offlineDepth, 0)
+        # the cleanups need the connection back
+        yield self._goOnline()
+
+    @defer.inlineCallbacks
+    def test_idempotent(self):
+        yield self._connect(offlinePolicy="idempotent")
+        yield self._goOffline()
+        yield self.assertFailure(self.db.incr(self.KEY), ConnectionError)
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, 1)
+
+    @defer.inlineCallbacks
+    def test_full(self):
+        yield self._connect(offlinePolicy="buffer", offlineMaxCommands=1)
+        yield self._goOffline()
+        d = self.db.get(self.KEY)
+        yield self.assertFailure(self.db.get(self.KEY), ConnectionError)
+        result = yield d
+        self.assertEqual(result, 1)
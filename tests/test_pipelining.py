@@ -25,6 +25,12 @@ class InspectableTransport(object):
                 self.write_history.append(data)
                 return self.original_transport.write(data, *args, **kwargs)
             return write
+        if method == "writeSequence":
+            def writeSequence(data, *args, **kwargs):
+                self.write_history.append("".join(data))
+                return self.original_transport.writeSequence(
+                    data, *args, **kwargs)
+            return writeSequence
         return getattr(self.original_transport, method)
 
 
@@ -128,3 +134,237 @@ class TestRedisConnections(unittest.TestCase):
         except NotImplementedError, e:
             self.assertTrue("not supported" in str(e).lower())
         yield db.disconnect()
+
+
+class TestPipelineResults(unittest.TestCase):
+    KEY = "trex:test_pipeline_results"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.Connection(
+            REDIS_HOST, REDIS_PORT, reconnect=False
+        )
+        yield self.db.delete(self.KEY)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEY)
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_results_in_order(self):
+        pipeline = yield self.db.pipeline()
+        pipeline.set(self.KEY, "foo")
+        pipeline.get(self.KEY)
+        pipeline.hmset(self.KEY + ":h", {"a": "1"})
+        pipeline.hgetall(self.KEY + ":h")
+        pipeline.delete(self.KEY + ":h")
+        results = yield pipeline.execute_pipeline()
+        self.assertEqual(results, [u"OK", u"foo", u"OK", {u"a": 1}, 1])
+
+    @defer.inlineCallbacks
+    def test_per_command_callbacks(self):
+        pipeline = yield self.db.pipeline()
+        seen = []
+        pipeline.set(self.KEY, "1")
+        pipeline.incr(self.KEY).addCallback(seen.append)
+        d = pipeline.get(self.KEY).asDeferred()
+        results = yield pipeline.execute_pipeline()
+        # the results hold what the callbacks returned
+        self.assertEqual(results, [u"OK", None, 2])
+        self.assertEqual(seen, [2])
+        result = yield d
+        self.assertEqual(result, 2)
+
+    @defer.inlineCallbacks
+    def test_first_error(self):
+        pipeline = yield self.db.pipeline()
+        pipeline.set(self.KEY, "foo")
+        pipeline.incr(self.KEY)
+        pipeline.get(self.KEY)
+        d = pipeline.execute_pipeline()
+        e = yield self.assertFailure(d, defer.FirstError)
+        self.assertEqual(e.index, 1)
+        e.subFailure.trap(trex.exceptions.ResponseError)
+        # the connection is usable again
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, u"foo")
+
+    @defer.inlineCallbacks
+    def test_errors_in_place(self):
+        pipeline = yield self.db.pipeline()
+        pipeline.set(self.KEY, "foo")
+        pipeline.incr(self.KEY)
+        pipeline.get(self.KEY)
+        pipeline.get(self.KEY).addCallback(lambda r: 1 / 0)
+        pipeline.set(self.KEY, "bar")
+        results = yield pipeline.execute_pipeline(raise_on_error=False)
+        self.assertEqual(results.failures, 2)
+        self.assertEqual(results.failed(), [1, 3])
+        self.assertEqual(results[::2], [u"OK", u"foo", u"OK"])
+        self.assertIsInstance(results[1], trex.exceptions.ResponseError)
+        self.assertIsInstance(results[3], ZeroDivisionError)
+
+        pipeline = yield self.db.pipeline()
+        pipeline.get(self.KEY)
+        results = yield pipeline.execute_pipeline(raise_on_error=False)
+        self.assertEqual(results, [u"bar"])
+        self.assertEqual(results.failures, 0)
+        self.assertEqual(results.failed(), [])
+
+    @defer.inlineCallbacks
+    def test_empty(self):
+        pipeline = yield self.db.pipeline()
+        results = yield pipeline.execute_pipeline()
+        self.assertEqual(results, [])
+        result = yield self.db.ping()
+        self.assertEqual(result, u"PONG")
+
+    def test_not_pipelining(self):
+        conn = self.db._factory.pool[0]
+        self.failureResultOf(
+            conn.execute_pipeline(), trex.exceptions.RedisError
+        )
+
+
+class TestPipelineStream(unittest.TestCase):
+    KEY = "trex:test_pipeline_stream"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.Connection(
+            REDIS_HOST, REDIS_PORT, reconnect=False
+        )
+        yield self.db.delete(self.KEY)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEY)
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_stream(self):
+        conn = self.db._factory.pool[0]
+        conn.transport = InspectableTransport(conn.transport)
+        self.addCleanup(
+            setattr, conn, "transport", conn.transport.original_transport
+        )
+        unacked = []
+        replies = []
+
+        def commands():
+            for i in xrange(100):
+                unacked.append(conn.outstanding)
+                yield ("RPUSH", self.KEY, i)
+
+        def callback(index, reply):
+            replies.append((index, reply))
+
+        stream = yield self.db.stream_pipeline(
+            commands(), callback, max_commands=10, max_unacked=25
+        )
+        self.assertEqual(stream.sent, 100)
+        self.assertEqual(stream.failures, 0)
+        self.assertEqual(replies, [(i, i + 1) for i in xrange(100)])
+        self.assertTrue(max(unacked) <= 25)
+        writes = conn.transport.write_history
+        self.assertTrue(len(writes) >= 10)
+        self.assertTrue(max(w.count("RPUSH") for w in writes) <= 10)
+        self.assertFalse(conn.pipelining)
+
+        result = yield self.db.llen(self.KEY)
+        self.assertEqual(result, 100)
+
+    @defer.inlineCallbacks
+    def test_errors(self):
+        replies = []
+        commands = [("SET", self.KEY, "foo"), ("INCR", self.KEY),
+                    ("GET", self.KEY)]
+        stream = yield self.db.stream_pipeline(
+            commands, lambda index, reply: replies.append(reply)
+        )
+        self.assertEqual(stream.failures, 1)
+        self.assertEqual(replies[0], u"OK")
+        self.assertIsInstance(replies[1], trex.exceptions.ResponseError)
+        self.assertEqual(replies[2], u"foo")
+
+    @defer.inlineCallbacks
+    def test_failing_iterable(self):
+        def commands():
+            yield ("SET", self.KEY, "foo")
+            raise ValueError("bad command")
+
+        d = self.db.stream_pipeline(commands())
+        yield self.assertFailure(d, ValueError)
+        # the connection is usable again
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, u"foo")
+
+
+class TestTransactionalPipeline(unittest.TestCase):
+    KEY = "trex:test_transactional_pipeline"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.Connection(
+            REDIS_HOST, REDIS_PORT, reconnect=False
+        )
+        yield self.db.delete(self.KEY)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEY)
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_single_write(self):
+        conn = self.db._factory.pool[0]
+        conn.transport = InspectableTransport(conn.transport)
+        self.addCleanup(
+            setattr, conn, "transport", conn.transport.original_transport
+        )
+        pipeline = yield self.db.pipeline(transaction=True)
+        pipeline.set(self.KEY, "1")
+        pipeline.incr(self.KEY)
+        pipeline.hmset(self.KEY + ":h", {"a": "1"})
+        pipeline.hgetall(self.KEY + ":h")
+        pipeline.delete(self.KEY + ":h")
+        results = yield pipeline.execute_pipeline()
+        # replies are mapped through each command's post_proc
+        self.assertEqual(results, [u"OK", 2, u"OK", {u"a": 1}, 1])
+        writes = conn.transport.write_history
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith("*1\r\n$5\r\nMULTI"))
+        self.assertTrue(writes[0].endswith("*1\r\n$4\r\nEXEC\r\n"))
+        self.assertFalse(conn.inTransaction)
+
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, 2)
+
+    @defer.inlineCallbacks
+    def test_errors(self):
+        pipeline = yield self.db.pipeline(transaction=True)
+        pipeline.set(self.KEY, "foo")
+        pipeline.incr(self.KEY)
+        pipeline.get(self.KEY)
+        d = pipeline.execute_pipeline()
+        e = yield self.assertFailure(d, defer.FirstError)
+        self.assertEqual(e.index, 1)
+
+        pipeline = yield self.db.pipeline(transaction=True)
+        pipeline.set(self.KEY, "foo")
+        pipeline.incr(self.KEY)
+        results = yield pipeline.execute_pipeline(raise_on_error=False)
+        self.assertEqual(results.failed(), [1])
+        self.assertIsInstance(results[1], trex.exceptions.ResponseError)
+
+    @defer.inlineCallbacks
+    def test_aborted(self):
+        pipeline = yield self.db.pipeline(transaction=True)
+        pipeline.set(self.KEY, "foo")
+        pipeline.execute_command("NOSUCHCOMMAND")
+        d = pipeline.execute_pipeline()
+        yield self.assertFailure(d, trex.exceptions.ResponseError)
+        # nothing was applied and the connection is usable again
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, None)
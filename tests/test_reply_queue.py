@@ -0,0 +1,51 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from trex.exceptions import ConnectionError, ResponseError
+from trex.protocols import ReplyQueue
+
+
+class TestReplyQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = ReplyQueue()
+
+    def test_replies_in_order(self):
+        ds = [self.queue.get() for _ in range(3)]
+        self.assertEqual(len(self.queue), 3)
+        for reply in ("a", "b", "c"):
+            self.queue.put(reply)
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(
+            [self.successResultOf(d) for d in ds], ["a", "b", "c"]
+        )
+
+    def test_errors(self):
+        d1, d2 = self.queue.get(), self.queue.get()
+        self.queue.put(ResponseError("ERR"))
+        self.queue.put("OK")
+        self.failureResultOf(d1, ResponseError)
+        self.assertEqual(self.successResultOf(d2), "OK")
+
+    def test_cancelled_keeps_its_place(self):
+        d1, d2 = self.queue.get(), self.queue.get()
+        d1.cancel()
+        self.failureResultOf(d1, defer.CancelledError)
+        self.assertEqual(len(self.queue), 2)
+        self.queue.put("a")
+        self.queue.put("b")
+        self.assertEqual(self.successResultOf(d2), "b")
+
+    def test_pending(self):
+        self.queue.put("a")
+        self.queue.put(ResponseError("ERR"))
+        self.assertEqual(self.successResultOf(self.queue.get()), "a")
+        self.failureResultOf(self.queue.get(), ResponseError)
+
+    def test_fail_all(self):
+        ds = [self.queue.get() for _ in range(3)]
+        ds[0].cancel()
+        self.queue.failAll(ConnectionError("Lost connection"))
+        self.assertEqual(len(self.queue), 0)
+        self.failureResultOf(ds[0], defer.CancelledError)
+        for d in ds[1:]:
+            self.failureResultOf(d, ConnectionError)
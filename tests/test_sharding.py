@@ -0,0 +1,164 @@
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from trex.connections import ShardedConnectionHandler
+from trex.exceptions import ConnectionError, ShardError
+
+
+class FakeFactory(object):
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+class FakeShard(object):
+    """
+    Stands in for the ConnectionHandler of a shard, keeping its values in a
+    dict.
+    """
+    def __init__(self, uuid, fails=False):
+        self._factory = FakeFactory(uuid)
+        self.data = {}
+        self.fails = fails
+        self.calls = []
+
+    def _call(self, f, arg):
+        self.calls.append(arg)
+        if self.fails:
+            return defer.fail(ConnectionError("Not connected"))
+        return defer.succeed(f(arg))
+
+    def mget(self, keys):
+        return self._call(lambda keys: [self.data.get(k) for k in keys], keys)
+
+    def delete(self, keys):
+        return self._call(
+            lambda keys: len([self.data.pop(k) for k in keys
+                              if k in self.data]), keys
+        )
+
+    unlink = delete
+
+    def exists(self, keys):
+        return self._call(
+            lambda keys: len([k for k in keys if k in self.data]), keys
+        )
+
+    def mset(self, mapping):
+        return self._call(lambda mapping: self.data.update(mapping) or "OK",
+                          mapping)
+
+    def msetnx(self, mapping):
+        return self._call(lambda mapping: 1, mapping)
+
+
+class TestShardedMget(unittest.TestCase):
+    KEYS = ["trex:test_sharding:%d" % x for x in xrange(50)]
+
+    def setUp(self):
+        self.shards = [FakeShard("10.0.0.%d:6379" % x) for x in xrange(3)]
+        self.db = ShardedConnectionHandler(self.shards)
+        for k in self.KEYS:
+            self.db._node(k).data[k] = k.upper()
+
+    @defer.inlineCallbacks
+    def test_order(self):
+        keys = list(reversed(self.KEYS)) + ["trex:test_sharding:missing"]
+        result = yield self.db.mget(keys)
+        self.assertEqual(result, [k.upper() for k in keys[:-1]] + [None])
+        for shard in self.shards:
+            self.assertEqual(len(shard.calls), 1)
+
+    @defer.inlineCallbacks
+    def test_batches(self):
+        result = yield self.db.mget(self.KEYS, batch_size=4)
+        self.assertEqual(result, [k.upper() for k in self.KEYS])
+        for shard in self.shards:
+            self.assertTrue(all(len(keys) <= 4 for keys in shard.calls))
+            self.assertEqual(
+                sum(len(keys) for keys in shard.calls), len(shard.data)
+            )
+
+    @defer.inlineCallbacks
+    def test_hash_tags(self):
+        keys = ["trex:{user1}:%d" % x for x in xrange(20)]
+        node = self.db._ring("user1")
+        for k in keys:
+            self.assertIs(self.db._node(k), node)
+            node.data[k] = k
+        result = yield self.db.mget(keys)
+        self.assertEqual(result, keys)
+        self.assertEqual(node.calls, [keys])
+
+    @defer.inlineCallbacks
+    def test_failed_shard(self):
+        failing = self.db._node(self.KEYS[0])
+        failing.fails = True
+        e = yield self.assertFailure(self.db.mget(self.KEYS), ShardError)
+        self.assertEqual(list(e.failures), [failing])
+        e.failures[failing].trap(ConnectionError)
+        for k, value in zip(self.KEYS, e.results):
+            if self.db._node(k) is failing:
+                self.assertEqual(value, None)
+            else:
+                self.assertEqual(value, k.upper())
+
+
+class TestShardedWrites(unittest.TestCase):
+    KEYS = ["trex:test_sharding:%d" % x for x in xrange(30)]
+
+    def setUp(self):
+        self.shards = [FakeShard("10.0.0.%d:6379" % x) for x in xrange(3)]
+        self.db = ShardedConnectionHandler(self.shards)
+
+    @defer.inlineCallbacks
+    def test_mset(self):
+        result = yield self.db.mset(dict((k, k.upper()) for k in self.KEYS))
+        self.assertEqual(result, True)
+        for shard in self.shards:
+            self.assertEqual(len(shard.calls), 1)
+            for k, v in shard.data.items():
+                self.assertIs(self.db._node(k), shard)
+                self.assertEqual(v, k.upper())
+        result = yield self.db.mget(self.KEYS)
+        self.assertEqual(result, [k.upper() for k in self.KEYS])
+
+    @defer.inlineCallbacks
+    def test_counts(self):
+        yield self.db.mset(dict((k, k) for k in self.KEYS[:20]))
+        result = yield self.db.exists(self.KEYS)
+        self.assertEqual(result, 20)
+        result = yield self.db.unlink(self.KEYS[:5])
+        self.assertEqual(result, 5)
+        result = yield self.db.delete(self.KEYS)
+        self.assertEqual(result, 15)
+        result = yield self.db.exists(self.KEYS[0])
+        self.assertEqual(result, 0)
+
+    @defer.inlineCallbacks
+    def test_failed_shard(self):
+        failing = self.db._node(self.KEYS[0])
+        failing.fails = True
+        d = self.db.mset(dict((k, k) for k in self.KEYS))
+        e = yield self.assertFailure(d, ShardError)
+        self.assertEqual(list(e.failures), [failing])
+        self.assertEqual(
+            sorted(e.results),
+            sorted(k for k in self.KEYS if self.db._node(k) is not failing)
+        )
+
+        # the keys set on the other shards are deleted and counted
+        e = yield self.assertFailure(self.db.delete(self.KEYS), ShardError)
+        self.assertEqual(list(e.failures), [failing])
+        self.assertEqual(
+            e.results,
+            len([k for k in self.KEYS if self.db._node(k) is not failing])
+        )
+
+    def test_msetnx(self):
+        keys = ["trex:{tag}:%d" % x for x in xrange(5)]
+        node = self.db._node(keys[0])
+        self.successResultOf(self.db.msetnx(dict((k, k) for k in keys)))
+        self.assertEqual(len(node.calls), 1)
+        self.assertRaises(
+            ValueError, self.db.msetnx, dict((k, k) for k in self.KEYS)
+        )
@@ -0,0 +1,66 @@
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from trex import redis
+from trex.strategies import (
+    get_strategy, LatencyStrategy, LeastOutstandingStrategy,
+    RoundRobinStrategy
+)
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+class FakeConnection(object):
+    def __init__(self, outstanding=0, latency=0.0):
+        self.outstanding = outstanding
+        self.latency = latency
+
+
+class TestStrategies(unittest.TestCase):
+    def test_get_strategy(self):
+        self.assertIsInstance(get_strategy(None), LeastOutstandingStrategy)
+        self.assertIsInstance(get_strategy('latency'), LatencyStrategy)
+        self.assertIsInstance(
+            get_strategy('Round-Robin'), RoundRobinStrategy
+        )
+        strategy = LatencyStrategy()
+        self.assertIs(get_strategy(strategy), strategy)
+        self.assertRaises(ValueError, get_strategy, 'fastest')
+        self.assertRaises(ValueError, get_strategy, object())
+
+    def test_round_robin(self):
+        conns = [FakeConnection(), FakeConnection(), FakeConnection()]
+        strategy = RoundRobinStrategy()
+        picked = [strategy.select(conns) for _ in range(6)]
+        self.assertEqual(picked, conns[1:] + conns + conns[:1])
+
+    def test_least_outstanding(self):
+        conns = [FakeConnection(3), FakeConnection(1), FakeConnection(2)]
+        self.assertIs(LeastOutstandingStrategy().select(conns), conns[1])
+
+    def test_latency(self):
+        slow = FakeConnection(outstanding=1, latency=0.050)
+        busy = FakeConnection(outstanding=10, latency=0.001)
+        fast = FakeConnection(outstanding=2, latency=0.002)
+        strategy = LatencyStrategy()
+        self.assertIs(strategy.select([slow, busy, fast]), fast)
+        unused = FakeConnection()
+        self.assertIs(strategy.select([slow, busy, fast, unused]), unused)
+
+
+class TestPoolCounters(unittest.TestCase):
+    @defer.inlineCallbacks
+    def test_counters(self):
+        db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, poolsize=2, reconnect=False,
+            multiplex=True, strategy='latency'
+        )
+        factory = db._factory
+        self.assertEqual(factory.outstanding, 0)
+        ds = [db.ping() for _ in range(6)]
+        self.assertEqual(factory.outstanding, 6)
+        yield defer.gatherResults(ds)
+        self.assertEqual(factory.outstanding, 0)
+        for conn in factory.pool:
+            self.assertTrue(conn.latency > 0)
+        yield db.disconnect()
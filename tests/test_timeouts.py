@@ -0,0 +1,147 @@
+from twisted.trial import unittest
+from twisted.internet import defer, protocol, reactor, task
+
+from trex import redis
+from trex.exceptions import TimeoutError
+from trex.timers import TimerHeap
+
+from .mixins import REDIS_HOST, REDIS_PORT
+
+
+class TestTimerHeap(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.timers = TimerHeap(self.clock)
+        self.fired = []
+
+    def test_single_delayed_call(self):
+        for x in (3, 1, 2):
+            self.timers.add(x, self.fired.append, x)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(1.5)
+        self.assertEqual(self.fired, [1])
+        self.clock.advance(5)
+        self.assertEqual(self.fired, [1, 2, 3])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_cancel(self):
+        t1 = self.timers.add(1, self.fired.append, 1)
+        self.timers.add(2, self.fired.append, 2)
+        self.timers.cancel(t1)
+        self.assertEqual(len(self.timers), 1)
+        self.clock.advance(3)
+        self.assertEqual(self.fired, [2])
+
+    def test_cancelling_everything_stops_the_call(self):
+        timers = [self.timers.add(x, self.fired.append, x) for x in range(5)]
+        for t in timers:
+            self.timers.cancel(t)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(len(self.timers), 0)
+
+    def test_compaction(self):
+        self.timers.COMPACT_THRESHOLD = 10
+        self.timers.add(100, self.fired.append, 100)
+        timers = [self.timers.add(x, self.fired.append, x) for x in range(50)]
+        for t in timers:
+            self.timers.cancel(t)
+        self.assertTrue(len(self.timers._heap) < 50)
+        self.clock.advance(200)
+        self.assertEqual(self.fired, [100])
+
+    def test_failing_callback(self):
+        def fail(x):
+            raise ValueError(x)
+        self.timers.add(1, self.fired.append, 1)
+        self.timers.add(1, fail, 1)
+        self.timers.add(1, self.fired.append, 2)
+        self.timers.add(2, self.fired.append, 3)
+        self.clock.advance(1)
+        self.assertEqual(self.fired, [1, 2])
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(1)
+        self.assertEqual(self.fired, [1, 2, 3])
+
+
+class StalledServer(protocol.Protocol):
+    def connectionMade(self):
+        self.factory.connections.append(self)
+
+    def dataReceived(self, data):
+        self.factory.received.append(data)
+
+
+class TestCommandTimeouts(unittest.TestCase):
+    def setUp(self):
+        factory = protocol.Factory()
+        factory.protocol = StalledServer
+        factory.connections = []
+        factory.received = []
+        self.server = factory
+        self.port = reactor.listenTCP(0, factory, interface="127.0.0.1")
+
+    def tearDown(self):
+        for conn in self.server.connections:
+            conn.transport.loseConnection()
+        return self.port.stopListening()
+
+    @defer.inlineCallbacks
+    def test_stalled_server(self):
+        db = yield redis.connect(
+            "127.0.0.1", self.port.getHost().port, reconnect=False,
+            commandTimeout=0.1
+        )
+        yield self.assertFailure(db.get("trex:test_timeout"), TimeoutError)
+        self.assertEqual(len(db._factory.timers), 0)
+        yield db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_expired_commands_are_not_sent(self):
+        db = yield redis.connect(
+            "127.0.0.1", self.port.getHost().port, reconnect=False
+        )
+        d1 = db.get("trex:first", commandTimeout=0.2)
+        d2 = db.get("trex:second", commandTimeout=0.1)
+        self.assertEqual(db._factory.waiters, 1)
+        yield self.assertFailure(d2, TimeoutError)
+        self.assertEqual(db._factory.waiters, 0)
+        yield self.assertFailure(d1, TimeoutError)
+        received = "".join(self.server.received)
+        self.assertTrue("trex:first" in received)
+        self.assertFalse("trex:second" in received)
+        yield db.disconnect()
+
+
+class TestDefaultTimeout(unittest.TestCase):
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.connect(
+            REDIS_HOST, REDIS_PORT, reconnect=False, commandTimeout=0.1
+        )
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.disconnect()
+
+    @defer.inlineCallbacks
+    def test_replies_before_deadline(self):
+        result = yield self.db.ping()
+        self.assertEqual(result, "PONG")
+        self.assertEqual(len(self.db._factory.timers), 0)
+
+    @defer.inlineCallbacks
+    def test_blocking_commands_are_exempt(self):
+        result = yield self.db.brpop("trex:test_timeout_queue", timeout=1)
+        self.assertEqual(result, None)
+
+    @defer.inlineCallbacks
+    def test_explicit_timeout_on_blocking_command(self):
+        d = self.db.brpop(
+            "trex:test_timeout_queue", timeout=1, commandTimeout=0.1
+        )
+        yield self.assertFailure(d, TimeoutError)
+        # the ping queues behind the BRPOP on the same connection; the late
+        # BRPOP reply is discarded rather than given to the ping
+        result = yield self.db.ping(commandTimeout=2)
+        self.assertEqual(result, "PONG")
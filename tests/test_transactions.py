@@ -117,3 +117,88 @@ class TestRedisConnections(unittest.TestCase):
         self.assertFalse(tx.inTransaction)
 
         yield rapi.disconnect()
+
+
+class TestOptimisticTransaction(unittest.TestCase):
+    KEY = "trex:test_optimistic_transaction"
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        self.db = yield redis.ConnectionPool(
+            REDIS_HOST, REDIS_PORT, poolsize=2, reconnect=False
+        )
+        self.other = yield redis.Connection(
+            REDIS_HOST, REDIS_PORT, reconnect=False
+        )
+        yield self.db.set(self.KEY, 1)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.db.delete(self.KEY)
+        yield self.db.disconnect()
+        yield self.other.disconnect()
+
+    @defer.inlineCallbacks
+    def test_retry(self):
+        calls = []
+
+        @defer.inlineCallbacks
+        def double(conn):
+            value = yield conn.get(self.KEY)
+            calls.append(value)
+            if len(calls) == 1:
+                # a concurrent write to the watched key
+                yield self.other.set(self.KEY, 5)
+            pipeline = yield conn.pipeline(transaction=True)
+            pipeline.set(self.KEY, value * 2)
+            pipeline.get(self.KEY)
+
+        results = yield self.db.transaction(double, self.KEY, backoff=0)
+        self.assertEqual(results, [u"OK", 10])
+        self.assertEqual(calls, [1, 5])
+        factory = self.db._factory
+        self.assertEqual(factory.transactionRetries, 1)
+        self.assertEqual(factory.transactionsFailed, 0)
+        self.assertEqual(len(factory.connectionQueue.pending), 2)
+
+    @defer.inlineCallbacks
+    def test_give_up(self):
+        @defer.inlineCallbacks
+        def conflict(conn):
+            yield self.other.incr(self.KEY)
+            pipeline = yield conn.pipeline(transaction=True)
+            pipeline.set(self.KEY, 0)
+
+        d = self.db.transaction(conflict, [self.KEY], max_retries=2,
+                                backoff=0)
+        yield self.assertFailure(d, trex.exceptions.WatchError)
+        factory = self.db._factory
+        self.assertEqual(factory.transactionRetries, 2)
+        self.assertEqual(factory.transactionsFailed, 1)
+        self.assertEqual(len(factory.connectionQueue.pending), 2)
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, 4)
+
+    @defer.inlineCallbacks
+    def test_failing_func(self):
+        def fail(conn):
+            conn.pipeline(transaction=True)
+            conn.set(self.KEY, 0)
+            raise ValueError("no")
+
+        d = self.db.transaction(fail, self.KEY)
+        yield self.assertFailure(d, ValueError)
+        factory = self.db._factory
+        self.assertEqual(len(factory.connectionQueue.pending), 2)
+        for conn in factory.pool:
+            self.assertFalse(conn.pipelining)
+            self.assertEqual(conn.outstanding, 0)
+        # nothing was sent
+        result = yield self.db.get(self.KEY)
+        self.assertEqual(result, 1)
+
+    @defer.inlineCallbacks
+    def test_nothing_to_write(self):
+        results = yield self.db.transaction(lambda conn: None, self.KEY)
+        self.assertEqual(results, None)
+        self.assertEqual(len(self.db._factory.connectionQueue.pending), 2)
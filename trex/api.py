@@ -1,19 +1,31 @@
 import hashlib
 import operator
+import time
 import warnings
 
 from .exceptions import (
     ConnectionError, InvalidData, RedisError, ResponseError, NoScriptRunning,
-    ScriptDoesNotExist, WatchError
+    ScriptDoesNotExist, TimeoutError, WatchError
 )
+from .decoding import AUTO, EXEC, FLOAT, INTEGER, RAW, TEXT, pairs, scan
+from .encoding import encode_command
+from .pipeline import Pipeline, PipelineResults, PipelineStream
 from .utils import list_or_args
 
 from twisted.python.failure import Failure
+from twisted.internet import reactor
 from twisted.internet.defer import (
-    fail, inlineCallbacks, returnValue, DeferredList, Deferred
+    fail, Deferred, FirstError
 )
 
 
+_BLOCKING_COMMANDS = frozenset(["BLPOP", "BRPOP", "BRPOPLPUSH"])
+
+_FIELDS_AND_VALUES = pairs(TEXT, AUTO)
+_MEMBERS_AND_SCORES = pairs(AUTO, FLOAT)
+_SCAN = scan()
+
+
 class RedisApiMixin():
 
     def execute_command(self, *args, **kwargs):
@@ -21,48 +33,47 @@ class RedisApiMixin():
             raise ConnectionError("Not connected")
         else:
 
-            # Build the redis command.
-            cmds = []
-            cmd_template = "$%s\r\n%s\r\n"
-            for s in args:
-                if isinstance(s, str):
-                    cmd = s
-                elif isinstance(s, unicode):
-                    if self.charset is None:
-                        raise InvalidData("Encoding charset was not specified")
-                    try:
-                        cmd = s.encode(self.charset, self.errors)
-                    except UnicodeEncodeError as e:
-                        raise InvalidData(
-                            "Error encoding unicode value '%s': %s" %
-                            (repr(s), e))
-                elif isinstance(s, float):
-                    try:
-                        cmd = format(s, "f")
-                    except NameError:
-                        cmd = "%0.6f" % s
-                else:
-                    cmd = str(s)
-                cmds.append(cmd_template % (len(cmd), cmd))
-            command = "*%s\r\n%s" % (len(cmds), "".join(cmds))
+            # Build the redis command, as a list of segments so that large
+            # values are written without being copied.
+            command = encode_command(args, self.charset, self.errors)
 
             # When pipelining, buffer this command into our list of
-            # pipelined commands. Otherwise, write the command immediately.
+            # pipelined commands. When auto-pipelining, buffer it until the
+            # end of the current reactor iteration. Otherwise, write the
+            # command immediately.
             if self.pipelining:
-                self.pipelined_commands.append(command)
+                self.pipelined_commands.extend(command)
+            elif self.autopipeline:
+                self._autopipeline(command)
             else:
-                self.transport.write(command)
+                self.transport.writeSequence(command)
 
             # Return deferred that will contain the result of this command.
-            # Note: when using pipelining, this deferred will NOT return
-            # until after execute_pipeline is called.
-            r = self.replyQueue.get().addCallback(self.handle_reply)
-
-            # When pipelining, we need to keep track of the deferred replies
-            # so that we can wait for them in a DeferredList when
-            # execute_pipeline is called.
+            # When pipelining, the reply is stored straight into the
+            # pipeline's results instead, and only gets a Deferred of its own
+            # if callbacks are added to it.
             if self.pipelining:
-                self.pipelined_replies.append(r)
+                r = self.pipelined_replies.add()
+                self.replyQueue.expect(r)
+            else:
+                r = self.replyQueue.get()
+            if self.typedReplies:
+                decoder = kwargs.get("decoder", AUTO)
+                if not self.decodeResponses and decoder is not EXEC:
+                    decoder = RAW
+                self._decoders.append(decoder)
+            self.lastActivity = now = time.time()
+            if self.trackLatency:
+                self._sentTimes.append(now)
+
+            # pipelined commands share the deadline of the whole pipeline
+            deadline = self.deadline
+            if deadline is None and self.factory.commandTimeout is not None \
+                    and args[0] not in _BLOCKING_COMMANDS:
+                deadline = self.factory.timers.seconds() + \
+                    self.factory.commandTimeout
+            if deadline is not None and not self.pipelining:
+                r = self._withDeadline(r, deadline)
 
             if self.inTransaction:
                 self.post_proc.append(kwargs.get("post_proc"))
@@ -74,51 +85,81 @@ class RedisApiMixin():
 
             return r
 
+    def _withDeadline(self, reply, deadline):
+        """
+        Return a Deferred which fails with TimeoutError unless reply fires
+        before deadline. The reply itself stays queued so that replies keep
+        matching their commands; it is discarded if it arrives too late.
+        """
+        d = Deferred()
+        timer = self.factory.timers.add(deadline, self._timedOut, d)
+        reply.addBoth(self._beforeDeadline, d, timer)
+        return d
+
+    def _timedOut(self, d):
+        d.errback(TimeoutError("Timed out waiting for a reply from redis"))
+
+    def _beforeDeadline(self, reply, d, timer):
+        if not d.called:
+            self.factory.timers.cancel(timer)
+            if isinstance(reply, Failure):
+                d.errback(reply)
+            else:
+                d.callback(reply)
+
     # Connection handling
     def quit(self):
         """
         Close the connection
         """
         self.factory.continueTrying = False
-        return self.execute_command("QUIT")
+        return self.execute_command("QUIT", decoder=TEXT)
 
     def auth(self, password):
         """
         Simple password authentication if enabled
         """
-        return self.execute_command("AUTH", password)
+        return self.execute_command("AUTH", password, decoder=TEXT)
 
     def ping(self):
         """
         Ping the server
         """
-        return self.execute_command("PING")
+        return self.execute_command("PING", decoder=TEXT)
 
     # Commands operating on all value types
-    def exists(self, key):
+    def exists(self, keys, *args):
         """
-        Test if a key exists
+        Test if a key exists, or count how many of several keys exist
         """
-        return self.execute_command("EXISTS", key)
+        keys = list_or_args("exists", keys, args)
+        return self.execute_command("EXISTS", *keys, decoder=INTEGER)
 
     def delete(self, keys, *args):
         """
         Delete one or more keys
         """
         keys = list_or_args("delete", keys, args)
-        return self.execute_command("DEL", *keys)
+        return self.execute_command("DEL", *keys, decoder=INTEGER)
+
+    def unlink(self, keys, *args):
+        """
+        Delete one or more keys, reclaiming their memory in the background
+        """
+        keys = list_or_args("unlink", keys, args)
+        return self.execute_command("UNLINK", *keys, decoder=INTEGER)
 
     def type(self, key):
         """
         Return the type of the value stored at key
         """
-        return self.execute_command("TYPE", key)
+        return self.execute_command("TYPE", key, decoder=TEXT)
 
     def keys(self, pattern="*"):
         """
         Return all the keys matching a given pattern
         """
-        return self.execute_command("KEYS", pattern)
+        return self.execute_command("KEYS", pattern, decoder=TEXT)
 
     @staticmethod
     def _build_scan_args(cursor, pattern, count):
@@ -138,63 +179,64 @@ class RedisApiMixin():
         Incrementally iterate the keys in database
         """
         args = self._build_scan_args(cursor, pattern, count)
-        return self.execute_command("SCAN", *args)
+        return self.execute_command("SCAN", *args, decoder=_SCAN)
 
     def randomkey(self):
         """
         Return a random key from the key space
         """
-        return self.execute_command("RANDOMKEY")
+        return self.execute_command("RANDOMKEY", decoder=TEXT)
 
     def rename(self, oldkey, newkey):
         """
         Rename the old key in the new one,
         destroying the newname key if it already exists
         """
-        return self.execute_command("RENAME", oldkey, newkey)
+        return self.execute_command("RENAME", oldkey, newkey, decoder=TEXT)
 
     def renamenx(self, oldkey, newkey):
         """
         Rename the oldname key to newname,
         if the newname key does not already exist
         """
-        return self.execute_command("RENAMENX", oldkey, newkey)
+        return self.execute_command(
+            "RENAMENX", oldkey, newkey, decoder=INTEGER)
 
     def dbsize(self):
         """
         Return the number of keys in the current db
         """
-        return self.execute_command("DBSIZE")
+        return self.execute_command("DBSIZE", decoder=INTEGER)
 
     def expire(self, key, time):
         """
         Set a time to live in seconds on a key
         """
-        return self.execute_command("EXPIRE", key, time)
+        return self.execute_command("EXPIRE", key, time, decoder=INTEGER)
 
     def persist(self, key):
         """
         Remove the expire from a key
         """
-        return self.execute_command("PERSIST", key)
+        return self.execute_command("PERSIST", key, decoder=INTEGER)
 
     def ttl(self, key):
         """
         Get the time to live in seconds of a key
         """
-        return self.execute_command("TTL", key)
+        return self.execute_command("TTL", key, decoder=INTEGER)
 
     def select(self, index):
         """
         Select the DB with the specified index
         """
-        return self.execute_command("SELECT", index)
+        return self.execute_command("SELECT", index, decoder=TEXT)
 
     def move(self, key, dbindex):
         """
         Move the key from the currently selected DB to the dbindex DB
         """
-        return self.execute_command("MOVE", key, dbindex)
+        return self.execute_command("MOVE", key, dbindex, decoder=INTEGER)
 
     def flush(self, all_dbs=False):
         warnings.warn(DeprecationWarning(
@@ -206,20 +248,20 @@ class RedisApiMixin():
         """
         Remove all the keys from the currently selected DB
         """
-        return self.execute_command("FLUSHDB")
+        return self.execute_command("FLUSHDB", decoder=TEXT)
 
     def flushall(self):
         """
         Remove all the keys from all the databases
         """
-        return self.execute_command("FLUSHALL")
+        return self.execute_command("FLUSHALL", decoder=TEXT)
 
     def time(self):
         """
         Returns the current server time as a two items lists: a Unix timestamp
         and the amount of microseconds already elapsed in the current second
         """
-        return self.execute_command("TIME")
+        return self.execute_command("TIME", decoder=INTEGER)
 
     # Commands operating on string values
     def set(self, key, value, expire=None, pexpire=None,
@@ -239,32 +281,33 @@ class RedisApiMixin():
             args.append("NX")
         if only_if_exists:
             args.append("XX")
-        return self.execute_command("SET", key, value, *args)
+        return self.execute_command("SET", key, value, *args, decoder=TEXT)
 
-    def get(self, key):
+    def get(self, key, decoder=AUTO):
         """
         Return the string value of the key
         """
-        return self.execute_command("GET", key)
+        return self.execute_command("GET", key, decoder=decoder)
 
     def getbit(self, key, offset):
         """
         Return the bit value at offset in the string value stored at key
         """
-        return self.execute_command("GETBIT", key, offset)
+        return self.execute_command("GETBIT", key, offset, decoder=INTEGER)
 
-    def getset(self, key, value):
+    def getset(self, key, value, decoder=AUTO):
         """
         Set a key to a string returning the old value of the key
         """
-        return self.execute_command("GETSET", key, value)
+        return self.execute_command("GETSET", key, value, decoder=decoder)
 
-    def mget(self, keys, *args):
+    def mget(self, keys, *args, **kwargs):
         """
         Multi-get, return the strings values of the keys
         """
         keys = list_or_args("mget", keys, args)
-        return self.execute_command("MGET", *keys)
+        return self.execute_command(
+            "MGET", *keys, decoder=kwargs.get("decoder", AUTO))
 
     def setbit(self, key, offset, value):
         """
@@ -272,19 +315,20 @@ class RedisApiMixin():
         """
         if isinstance(value, bool):
             value = int(value)
-        return self.execute_command("SETBIT", key, offset, value)
+        return self.execute_command(
+            "SETBIT", key, offset, value, decoder=INTEGER)
 
     def setnx(self, key, value):
         """
         Set a key to a string value if the key does not exist
         """
-        return self.execute_command("SETNX", key, value)
+        return self.execute_command("SETNX", key, value, decoder=INTEGER)
 
     def setex(self, key, time, value):
         """
         Set+Expire combo command
         """
-        return self.execute_command("SETEX", key, time, value)
+        return self.execute_command("SETEX", key, time, value, decoder=TEXT)
 
     def mset(self, mapping):
         """
@@ -294,7 +338,7 @@ class RedisApiMixin():
         items = []
         for pair in mapping.iteritems():
             items.extend(pair)
-        return self.execute_command("MSET", *items)
+        return self.execute_command("MSET", *items, decoder=TEXT)
 
     def msetnx(self, mapping):
         """
@@ -304,7 +348,7 @@ class RedisApiMixin():
         items = []
         for pair in mapping.iteritems():
             items.extend(pair)
-        return self.execute_command("MSETNX", *items)
+        return self.execute_command("MSETNX", *items, decoder=INTEGER)
 
     def bitop(self, operation, destkey, *srckeys):
         """
@@ -330,7 +374,8 @@ class RedisApiMixin():
         if operation == 'NOT' and srclen > 1:
             return fail(RedisError(
                 "bitop NOT takes only one ``srckey``"))
-        return self.execute_command('BITOP', operation, destkey, *srckeys)
+        return self.execute_command(
+            'BITOP', operation, destkey, *srckeys, decoder=INTEGER)
 
     def bitcount(self, key, start=None, end=None):
         if (end is None and start is not None) or \
@@ -340,13 +385,13 @@ class RedisApiMixin():
             t = (start, end)
         else:
             t = ()
-        return self.execute_command("BITCOUNT", key, *t)
+        return self.execute_command("BITCOUNT", key, *t, decoder=INTEGER)
 
     def incr(self, key, amount=1):
         """
         Increment the integer value of key
         """
-        return self.execute_command("INCRBY", key, amount)
+        return self.execute_command("INCRBY", key, amount, decoder=INTEGER)
 
     def incrby(self, key, amount):
         """
@@ -358,7 +403,7 @@ class RedisApiMixin():
         """
         Decrement the integer value of key
         """
-        return self.execute_command("DECRBY", key, amount)
+        return self.execute_command("DECRBY", key, amount, decoder=INTEGER)
 
     def decrby(self, key, amount):
         """
@@ -370,13 +415,14 @@ class RedisApiMixin():
         """
         Append the specified string to the string stored at key
         """
-        return self.execute_command("APPEND", key, value)
+        return self.execute_command("APPEND", key, value, decoder=INTEGER)
 
-    def substr(self, key, start, end=-1):
+    def substr(self, key, start, end=-1, decoder=AUTO):
         """
         Return a substring of a larger string
         """
-        return self.execute_command("SUBSTR", key, start, end)
+        return self.execute_command(
+            "SUBSTR", key, start, end, decoder=decoder)
 
     # Commands operating on lists
     def push(self, key, value, tail=False):
@@ -391,55 +437,56 @@ class RedisApiMixin():
         Append an element to the tail of the List value at key
         """
         if isinstance(value, tuple) or isinstance(value, list):
-            return self.execute_command("RPUSH", key, *value)
+            return self.execute_command("RPUSH", key, *value, decoder=INTEGER)
         else:
-            return self.execute_command("RPUSH", key, value)
+            return self.execute_command("RPUSH", key, value, decoder=INTEGER)
 
     def lpush(self, key, value):
         """
         Append an element to the head of the List value at key
         """
         if isinstance(value, tuple) or isinstance(value, list):
-            return self.execute_command("LPUSH", key, *value)
+            return self.execute_command("LPUSH", key, *value, decoder=INTEGER)
         else:
-            return self.execute_command("LPUSH", key, value)
+            return self.execute_command("LPUSH", key, value, decoder=INTEGER)
 
     def llen(self, key):
         """
         Return the length of the List value at key
         """
-        return self.execute_command("LLEN", key)
+        return self.execute_command("LLEN", key, decoder=INTEGER)
 
-    def lrange(self, key, start, end):
+    def lrange(self, key, start, end, decoder=AUTO):
         """
         Return a range of elements from the List at key
         """
-        return self.execute_command("LRANGE", key, start, end)
+        return self.execute_command(
+            "LRANGE", key, start, end, decoder=decoder)
 
     def ltrim(self, key, start, end):
         """
         Trim the list at key to the specified range of elements
         """
-        return self.execute_command("LTRIM", key, start, end)
+        return self.execute_command("LTRIM", key, start, end, decoder=TEXT)
 
-    def lindex(self, key, index):
+    def lindex(self, key, index, decoder=AUTO):
         """
         Return the element at index position from the List at key
         """
-        return self.execute_command("LINDEX", key, index)
+        return self.execute_command("LINDEX", key, index, decoder=decoder)
 
     def lset(self, key, index, value):
         """
         Set a new value as the element at index position of the List at key
         """
-        return self.execute_command("LSET", key, index, value)
+        return self.execute_command("LSET", key, index, value, decoder=TEXT)
 
     def lrem(self, key, count, value):
         """
         Remove the first-N, last-N, or all the elements matching value
         from the List at key
         """
-        return self.execute_command("LREM", key, count, value)
+        return self.execute_command("LREM", key, count, value, decoder=INTEGER)
 
     def pop(self, key, tail=False):
         warnings.warn(DeprecationWarning(
@@ -448,19 +495,19 @@ class RedisApiMixin():
 
         return tail and self.rpop(key) or self.lpop(key)
 
-    def lpop(self, key):
+    def lpop(self, key, decoder=AUTO):
         """
         Return and remove (atomically) the first element of the List at key
         """
-        return self.execute_command("LPOP", key)
+        return self.execute_command("LPOP", key, decoder=decoder)
 
-    def rpop(self, key):
+    def rpop(self, key, decoder=AUTO):
         """
         Return and remove (atomically) the last element of the List at key
         """
-        return self.execute_command("RPOP", key)
+        return self.execute_command("RPOP", key, decoder=decoder)
 
-    def blpop(self, keys, timeout=0):
+    def blpop(self, keys, timeout=0, decoder=AUTO):
         """
         Blocking LPOP
         """
@@ -470,9 +517,9 @@ class RedisApiMixin():
             keys = list(keys)
 
         keys.append(timeout)
-        return self.execute_command("BLPOP", *keys)
+        return self.execute_command("BLPOP", *keys, decoder=decoder)
 
-    def brpop(self, keys, timeout=0):
+    def brpop(self, keys, timeout=0, decoder=AUTO):
         """
         Blocking RPOP
         """
@@ -482,22 +529,24 @@ class RedisApiMixin():
             keys = list(keys)
 
         keys.append(timeout)
-        return self.execute_command("BRPOP", *keys)
+        return self.execute_command("BRPOP", *keys, decoder=decoder)
 
-    def brpoplpush(self, source, destination, timeout=0):
+    def brpoplpush(self, source, destination, timeout=0, decoder=AUTO):
         """
         Pop a value from a list, push it to another list and return
         it; or block until one is available.
         """
-        return self.execute_command("BRPOPLPUSH", source, destination, timeout)
+        return self.execute_command(
+            "BRPOPLPUSH", source, destination, timeout, decoder=decoder)
 
-    def rpoplpush(self, srckey, dstkey):
+    def rpoplpush(self, srckey, dstkey, decoder=AUTO):
         """
         Return and remove (atomically) the last element of the source
         List  stored at srckey and push the same element to the
         destination List stored at dstkey
         """
-        return self.execute_command("RPOPLPUSH", srckey, dstkey)
+        return self.execute_command(
+            "RPOPLPUSH", srckey, dstkey, decoder=decoder)
 
     def _make_set(self, result):
         if isinstance(result, list):
@@ -510,47 +559,49 @@ class RedisApiMixin():
         Add the specified member to the Set value at key
         """
         members = list_or_args("sadd", members, args)
-        return self.execute_command("SADD", key, *members)
+        return self.execute_command("SADD", key, *members, decoder=INTEGER)
 
     def srem(self, key, members, *args):
         """
         Remove the specified member from the Set value at key
         """
         members = list_or_args("srem", members, args)
-        return self.execute_command("SREM", key, *members)
+        return self.execute_command("SREM", key, *members, decoder=INTEGER)
 
-    def spop(self, key):
+    def spop(self, key, decoder=AUTO):
         """
         Remove and return (pop) a random element from the Set value at key
         """
-        return self.execute_command("SPOP", key)
+        return self.execute_command("SPOP", key, decoder=decoder)
 
     def smove(self, srckey, dstkey, member):
         """
         Move the specified member from one Set to another atomically
         """
         return self.execute_command(
-            "SMOVE", srckey, dstkey, member).addCallback(bool)
+            "SMOVE", srckey, dstkey, member, decoder=INTEGER).addCallback(bool)
 
     def scard(self, key):
         """
         Return the number of elements (the cardinality) of the Set at key
         """
-        return self.execute_command("SCARD", key)
+        return self.execute_command("SCARD", key, decoder=INTEGER)
 
     def sismember(self, key, value):
         """
         Test if the specified value is a member of the Set at key
         """
-        return self.execute_command("SISMEMBER", key, value).addCallback(bool)
+        return self.execute_command(
+            "SISMEMBER", key, value, decoder=INTEGER).addCallback(bool)
 
-    def sinter(self, keys, *args):
+    def sinter(self, keys, *args, **kwargs):
         """
         Return the intersection between the Sets stored at key1, ..., keyN
         """
         keys = list_or_args("sinter", keys, args)
-        return self.execute_command("SINTER", *keys).addCallback(
-            self._make_set)
+        return self.execute_command(
+            "SINTER", *keys, decoder=kwargs.get("decoder", AUTO)
+        ).addCallback(self._make_set)
 
     def sinterstore(self, dstkey, keys, *args):
         """
@@ -558,15 +609,17 @@ class RedisApiMixin():
         at key1, key2, ..., keyN, and store the resulting Set at dstkey
         """
         keys = list_or_args("sinterstore", keys, args)
-        return self.execute_command("SINTERSTORE", dstkey, *keys)
+        return self.execute_command(
+            "SINTERSTORE", dstkey, *keys, decoder=INTEGER)
 
-    def sunion(self, keys, *args):
+    def sunion(self, keys, *args, **kwargs):
         """
         Return the union between the Sets stored at key1, key2, ..., keyN
         """
         keys = list_or_args("sunion", keys, args)
-        return self.execute_command("SUNION", *keys).addCallback(
-            self._make_set)
+        return self.execute_command(
+            "SUNION", *keys, decoder=kwargs.get("decoder", AUTO)
+        ).addCallback(self._make_set)
 
     def sunionstore(self, dstkey, keys, *args):
         """
@@ -574,16 +627,18 @@ class RedisApiMixin():
         at key1, key2, ..., keyN, and store the resulting Set at dstkey
         """
         keys = list_or_args("sunionstore", keys, args)
-        return self.execute_command("SUNIONSTORE", dstkey, *keys)
+        return self.execute_command(
+            "SUNIONSTORE", dstkey, *keys, decoder=INTEGER)
 
-    def sdiff(self, keys, *args):
+    def sdiff(self, keys, *args, **kwargs):
         """
         Return the difference between the Set stored at key1 and
         all the Sets key2, ..., keyN
         """
         keys = list_or_args("sdiff", keys, args)
-        return self.execute_command("SDIFF", *keys).addCallback(
-            self._make_set)
+        return self.execute_command(
+            "SDIFF", *keys, decoder=kwargs.get("decoder", AUTO)
+        ).addCallback(self._make_set)
 
     def sdiffstore(self, dstkey, keys, *args):
         """
@@ -591,24 +646,25 @@ class RedisApiMixin():
         Sets key2, ..., keyN, and store the resulting Set at dstkey
         """
         keys = list_or_args("sdiffstore", keys, args)
-        return self.execute_command("SDIFFSTORE", dstkey, *keys)
+        return self.execute_command(
+            "SDIFFSTORE", dstkey, *keys, decoder=INTEGER)
 
-    def smembers(self, key):
+    def smembers(self, key, decoder=AUTO):
         """
         Return all the members of the Set value at key
         """
-        return self.execute_command("SMEMBERS", key).addCallback(
-            self._make_set)
+        return self.execute_command(
+            "SMEMBERS", key, decoder=decoder).addCallback(self._make_set)
 
-    def srandmember(self, key):
+    def srandmember(self, key, decoder=AUTO):
         """
         Return a random member of the Set value at key
         """
-        return self.execute_command("SRANDMEMBER", key)
+        return self.execute_command("SRANDMEMBER", key, decoder=decoder)
 
     def sscan(self, key, cursor=0, pattern=None, count=None):
         args = self._build_scan_args(cursor, pattern, count)
-        return self.execute_command("SSCAN", key, *args)
+        return self.execute_command("SSCAN", key, *args, decoder=_SCAN)
 
     # Commands operating on sorted zsets (sorted sets)
     def zadd(self, key, score, member, *args):
@@ -627,13 +683,13 @@ class RedisApiMixin():
                 args = l
         else:
             args = [score, member]
-        return self.execute_command("ZADD", key, *args)
+        return self.execute_command("ZADD", key, *args, decoder=INTEGER)
 
     def zrem(self, key, *args):
         """
         Remove the specified member from the Sorted Set value at key
         """
-        return self.execute_command("ZREM", key, *args)
+        return self.execute_command("ZREM", key, *args, decoder=INTEGER)
 
     def zincr(self, key, member):
         return self.zincrby(key, 1, member)
@@ -646,21 +702,28 @@ class RedisApiMixin():
         If the member already exists increment its score by increment,
         otherwise add the member setting increment as score
         """
-        return self.execute_command("ZINCRBY", key, increment, member)
+        return self.execute_command(
+            "ZINCRBY", key, increment, member, decoder=FLOAT)
 
     def zrank(self, key, member):
         """
         Return the rank (or index) or member in the sorted set at key,
         with scores being ordered from low to high
         """
-        return self.execute_command("ZRANK", key, member)
+        return self.execute_command("ZRANK", key, member, decoder=INTEGER)
 
     def zrevrank(self, key, member):
         """
         Return the rank (or index) or member in the sorted set at key,
         with scores being ordered from high to low
         """
-        return self.execute_command("ZREVRANK", key, member)
+        return self.execute_command("ZREVRANK", key, member, decoder=INTEGER)
+
+    @staticmethod
+    def _members_and_scores(decoder):
+        if decoder is AUTO:
+            return _MEMBERS_AND_SCORES
+        return pairs(decoder, FLOAT)
 
     def _handle_withscores(self, r):
         if isinstance(r, list):
@@ -668,35 +731,38 @@ class RedisApiMixin():
             return zip(r[::2], r[1::2])
         return r
 
-    def _zrange(self, key, start, end, withscores, reverse):
+    def _zrange(self, key, start, end, withscores, reverse, decoder):
         if reverse:
             cmd = "ZREVRANGE"
         else:
             cmd = "ZRANGE"
         if withscores:
             pieces = (cmd, key, start, end, "WITHSCORES")
+            decoder = self._members_and_scores(decoder)
         else:
             pieces = (cmd, key, start, end)
-        r = self.execute_command(*pieces)
+        r = self.execute_command(*pieces, decoder=decoder)
         if withscores:
             r.addCallback(self._handle_withscores)
         return r
 
-    def zrange(self, key, start=0, end=-1, withscores=False):
+    def zrange(self, key, start=0, end=-1, withscores=False, decoder=AUTO):
         """
         Return a range of elements from the sorted set at key
         """
-        return self._zrange(key, start, end, withscores, False)
+        return self._zrange(key, start, end, withscores, False, decoder)
 
-    def zrevrange(self, key, start=0, end=-1, withscores=False):
+    def zrevrange(self, key, start=0, end=-1, withscores=False,
+                  decoder=AUTO):
         """
         Return a range of elements from the sorted set at key,
         exactly like ZRANGE, but the sorted set is ordered in
         traversed in reverse order, from the greatest to the smallest score
         """
-        return self._zrange(key, start, end, withscores, True)
+        return self._zrange(key, start, end, withscores, True, decoder)
 
-    def _zrangebyscore(self, key, min, max, withscores, offset, count, rev):
+    def _zrangebyscore(self, key, min, max, withscores, offset, count, rev,
+                       decoder):
         if rev:
             cmd = "ZREVRANGEBYSCORE"
         else:
@@ -706,32 +772,33 @@ class RedisApiMixin():
                 "Invalid count and offset arguments to %s" % cmd))
         if withscores:
             pieces = [cmd, key, min, max, "WITHSCORES"]
+            decoder = self._members_and_scores(decoder)
         else:
             pieces = [cmd, key, min, max]
         if offset is not None and count is not None:
             pieces.extend(("LIMIT", offset, count))
-        r = self.execute_command(*pieces)
+        r = self.execute_command(*pieces, decoder=decoder)
         if withscores:
             r.addCallback(self._handle_withscores)
         return r
 
     def zrangebyscore(self, key, min='-inf', max='+inf', withscores=False,
-                      offset=None, count=None):
+                      offset=None, count=None, decoder=AUTO):
         """
         Return all the elements with score >= min and score <= max
         (a range query) from the sorted set
         """
         return self._zrangebyscore(key, min, max, withscores, offset,
-                                   count, False)
+                                   count, False, decoder)
 
     def zrevrangebyscore(self, key, max='+inf', min='-inf', withscores=False,
-                         offset=None, count=None):
+                         offset=None, count=None, decoder=AUTO):
         """
         ZRANGEBYSCORE in reverse order
         """
         # ZREVRANGEBYSCORE takes max before min
         return self._zrangebyscore(key, max, min, withscores, offset,
-                                   count, True)
+                                   count, True, decoder)
 
     def zcount(self, key, min='-inf', max='+inf'):
         """
@@ -740,34 +807,36 @@ class RedisApiMixin():
         """
         if min == '-inf' and max == '+inf':
             return self.zcard(key)
-        return self.execute_command("ZCOUNT", key, min, max)
+        return self.execute_command("ZCOUNT", key, min, max, decoder=INTEGER)
 
     def zcard(self, key):
         """
         Return the cardinality (number of elements) of the sorted set at key
         """
-        return self.execute_command("ZCARD", key)
+        return self.execute_command("ZCARD", key, decoder=INTEGER)
 
     def zscore(self, key, element):
         """
         Return the score associated with the specified element of the sorted
         set at key
         """
-        return self.execute_command("ZSCORE", key, element)
+        return self.execute_command("ZSCORE", key, element, decoder=FLOAT)
 
     def zremrangebyrank(self, key, min=0, max=-1):
         """
         Remove all the elements with rank >= min and rank <= max from
         the sorted set
         """
-        return self.execute_command("ZREMRANGEBYRANK", key, min, max)
+        return self.execute_command(
+            "ZREMRANGEBYRANK", key, min, max, decoder=INTEGER)
 
     def zremrangebyscore(self, key, min='-inf', max='+inf'):
         """
         Remove all the elements with score >= min and score <= max from
         the sorted set
         """
-        return self.execute_command("ZREMRANGEBYSCORE", key, min, max)
+        return self.execute_command(
+            "ZREMRANGEBYSCORE", key, min, max, decoder=INTEGER)
 
     def zunionstore(self, dstkey, keys, aggregate=None):
         """
@@ -813,37 +882,38 @@ class RedisApiMixin():
                     return fail(InvalidData(
                         "Invalid aggregate function: %s" % aggregate))
             pieces.extend(("AGGREGATE", aggregate))
-        return self.execute_command(*pieces)
+        return self.execute_command(*pieces, decoder=INTEGER)
 
     def zscan(self, key, cursor=0, pattern=None, count=None):
         args = self._build_scan_args(cursor, pattern, count)
-        return self.execute_command("ZSCAN", key, *args)
+        return self.execute_command("ZSCAN", key, *args, decoder=_SCAN)
 
     # Commands operating on hashes
     def hset(self, key, field, value):
         """
         Set the hash field to the specified value. Creates the hash if needed
         """
-        return self.execute_command("HSET", key, field, value)
+        return self.execute_command("HSET", key, field, value, decoder=INTEGER)
 
     def hsetnx(self, key, field, value):
         """
         Set the hash field to the specified value if the field does not exist.
         Creates the hash if needed
         """
-        return self.execute_command("HSETNX", key, field, value)
+        return self.execute_command(
+            "HSETNX", key, field, value, decoder=INTEGER)
 
-    def hget(self, key, field):
+    def hget(self, key, field, decoder=AUTO):
         """
         Retrieve the value of the specified hash field.
         """
-        return self.execute_command("HGET", key, field)
+        return self.execute_command("HGET", key, field, decoder=decoder)
 
-    def hmget(self, key, fields):
+    def hmget(self, key, fields, decoder=AUTO):
         """
         Get the hash values associated to the specified fields.
         """
-        return self.execute_command("HMGET", key, *fields)
+        return self.execute_command("HMGET", key, *fields, decoder=decoder)
 
     def hmset(self, key, mapping):
         """
@@ -852,7 +922,7 @@ class RedisApiMixin():
         items = []
         for pair in mapping.iteritems():
             items.extend(pair)
-        return self.execute_command("HMSET", key, *items)
+        return self.execute_command("HMSET", key, *items, decoder=TEXT)
 
     def hincr(self, key, field):
         return self.hincrby(key, field, 1)
@@ -864,13 +934,14 @@ class RedisApiMixin():
         """
         Increment the integer value of the hash at key on field with integer.
         """
-        return self.execute_command("HINCRBY", key, field, integer)
+        return self.execute_command(
+            "HINCRBY", key, field, integer, decoder=INTEGER)
 
     def hexists(self, key, field):
         """
         Test for existence of a specified field in a hash
         """
-        return self.execute_command("HEXISTS", key, field)
+        return self.execute_command("HEXISTS", key, field, decoder=INTEGER)
 
     def hdel(self, key, fields):
         """
@@ -880,40 +951,45 @@ class RedisApiMixin():
             fields = [fields]
         else:
             fields = list(fields)
-        return self.execute_command("HDEL", key, *fields)
+        return self.execute_command("HDEL", key, *fields, decoder=INTEGER)
 
     def hlen(self, key):
         """
         Return the number of items in a hash.
         """
-        return self.execute_command("HLEN", key)
+        return self.execute_command("HLEN", key, decoder=INTEGER)
 
     def hkeys(self, key):
         """
         Return all the fields in a hash.
         """
-        return self.execute_command("HKEYS", key)
+        return self.execute_command("HKEYS", key, decoder=TEXT)
 
-    def hvals(self, key):
+    def hvals(self, key, decoder=AUTO):
         """
         Return all the values in a hash.
         """
-        return self.execute_command("HVALS", key)
+        return self.execute_command("HVALS", key, decoder=decoder)
 
-    def hgetall(self, key):
+    def hgetall(self, key, decoder=AUTO):
         """
         Return all the fields and associated values in a hash.
         """
         f = lambda d: dict(zip(d[::2], d[1::2]))
-        return self.execute_command("HGETALL", key, post_proc=f)
+        if decoder is not AUTO:
+            decoder = pairs(TEXT, decoder)
+        else:
+            decoder = _FIELDS_AND_VALUES
+        return self.execute_command(
+            "HGETALL", key, post_proc=f, decoder=decoder)
 
     def hscan(self, key, cursor=0, pattern=None, count=None):
         args = self._build_scan_args(cursor, pattern, count)
-        return self.execute_command("HSCAN", key, *args)
+        return self.execute_command("HSCAN", key, *args, decoder=_SCAN)
 
     # Sorting
     def sort(self, key, start=None, end=None, by=None, get=None,
-             desc=None, alpha=False, store=None):
+             desc=None, alpha=False, store=None, decoder=AUTO):
         if (start is not None and end is None) or \
            (end is not None and start is None):
             raise RedisError("``start`` and ``end`` must both be specified")
@@ -937,7 +1013,7 @@ class RedisApiMixin():
             pieces.append("STORE")
             pieces.append(store)
 
-        return self.execute_command("SORT", *pieces)
+        return self.execute_command("SORT", *pieces, decoder=decoder)
 
     def _clear_txstate(self):
         if self.inTransaction:
@@ -951,12 +1027,13 @@ class RedisApiMixin():
             self.commit_cc = lambda: ()
         if isinstance(keys, (str, unicode)):
             keys = [keys]
-        d = self.execute_command("WATCH", *keys).addCallback(self._tx_started)
+        d = self.execute_command("WATCH", *keys, decoder=TEXT)
+        d.addCallback(self._tx_started)
         return d
 
     def unwatch(self):
         self.unwatch_cc()
-        return self.execute_command("UNWATCH")
+        return self.execute_command("UNWATCH", decoder=TEXT)
 
     # Transactions
     # multi() will return a deferred with a "connection" object
@@ -969,9 +1046,10 @@ class RedisApiMixin():
         self.commit_cc = self._clear_txstate
         if keys is not None:
             d = self.watch(keys)
-            d.addCallback(lambda _: self.execute_command("MULTI"))
+            d.addCallback(
+                lambda _: self.execute_command("MULTI", decoder=TEXT))
         else:
-            d = self.execute_command("MULTI")
+            d = self.execute_command("MULTI", decoder=TEXT)
         d.addCallback(self._tx_started)
         return d
 
@@ -991,7 +1069,8 @@ class RedisApiMixin():
     def commit(self):
         if self.inTransaction is False:
             raise RedisError("Not in transaction")
-        return self.execute_command("EXEC").addCallback(self._commit_check)
+        return self.execute_command("EXEC", decoder=EXEC).addCallback(
+            self._commit_check)
 
     def discard(self):
         if self.inTransaction is False:
@@ -999,47 +1078,180 @@ class RedisApiMixin():
         self.post_proc = []
         self.transactions = 0
         self._clear_txstate()
-        return self.execute_command("DISCARD")
+        return self.execute_command("DISCARD", decoder=EXEC)
 
     # Returns a proxy that works just like .multi() except that commands
     # are simply buffered to be written all at once in a pipeline.
     # http://redis.io/topics/pipelining
-    def pipeline(self):
+    def pipeline(self, transaction=False):
         """
         Return a deferred that returns self (rather than simply self) to allow
         ConnectionHandler to wrap this method with async connection retrieval.
+
+        With transaction=True the pipelined commands are wrapped in MULTI and
+        EXEC, all written at once, and execute_pipeline() returns the reply
+        to EXEC.
         """
         self.pipelining = True
         self.pipelined_commands = []
-        self.pipelined_replies = []
+        self.pipelined_replies = Pipeline()
+        if transaction:
+            self.pipelined_replies.transaction = True
+            self.inTransaction = True
+            self.unwatch_cc = lambda: ()
+            self.commit_cc = self._pipeline_committed
+            self.execute_command("MULTI", decoder=TEXT)
         d = Deferred()
         d.addCallback(lambda x: x)
         d.callback(self)
         return d
 
-    @inlineCallbacks
-    def execute_pipeline(self):
+    def execute_pipeline(self, raise_on_error=True):
+        """
+        Send the pipelined commands and return a Deferred firing with their
+        replies, as a PipelineResults list.
+
+        By default the first command to fail fails the whole pipeline. With
+        raise_on_error=False every reply is returned, failed commands having
+        their exception in place of a reply.
+
+        A transactional pipeline fails if the transaction is aborted, and
+        with WatchError if a watched key changed.
+        """
         if not self.pipelining:
-            raise RedisError(
+            return fail(RedisError(
                 "Not currently pipelining commands, please use pipeline() "
                 "first"
+            ))
+
+        # Flush all the commands at once to redis. The replies fill the
+        # pipeline's results as they arrive, and its Deferred fires with
+        # them once the last one is in. Anything auto-pipelined before
+        # pipeline() was entered must hit the wire first, otherwise the
+        # replies would be out of order.
+        pipeline = self.pipelined_replies
+        if pipeline.transaction:
+            self.execute_command("EXEC", decoder=EXEC)
+        self.flush_autopipeline()
+        self.transport.writeSequence(self.pipelined_commands)
+        self.pipelining = False
+        self.pipelined_commands = []
+        self.pipelined_replies = None
+
+        d = pipeline.execute(raise_on_error or pipeline.transaction)
+        if self.factory.commandTimeout is not None and not d.called:
+            d = self._withDeadline(
+                d, self.factory.timers.seconds() + self.factory.commandTimeout
             )
+        d.addBoth(self._pipelineDone, pipeline.transaction)
+        if pipeline.transaction:
+            d.addCallbacks(
+                self._execResults, self._execFailed,
+                callbackArgs=(raise_on_error,)
+            )
+        return d
 
-        # Flush all the commands at once to redis. Wait for all replies
-        # to come back using a deferred list.
-        try:
-            self.transport.write("".join(self.pipelined_commands))
-            results = yield DeferredList(
-                deferredList=self.pipelined_replies,
-                fireOnOneErrback=True,
-                consumeErrors=True,
-                )
-            returnValue([value for success, value in results])
-
-        finally:
-            self.pipelining = False
-            self.pipelined_commands = []
-            self.pipelined_replies = []
+    def _pipeline_committed(self):
+        # the EXEC reply gets mapped through post_proc, but the connection
+        # only goes back to the pool once the whole pipeline is done
+        self.inTransaction = False
+
+    def _pipelineDone(self, result, transaction=False):
+        if transaction:
+            self.post_proc = []
+            self.transactions = 0
+            self._queuedDecoders = []
+            self.inTransaction = False
+        self.factory.connectionQueue.put(self)
+        return result
+
+    def _execResults(self, results, raise_on_error):
+        reply = results[-1]
+        if reply is None:
+            raise WatchError("Transaction failed")
+        results = PipelineResults(reply)
+        for i, x in enumerate(results):
+            if isinstance(x, Exception):
+                if raise_on_error:
+                    raise FirstError(Failure(x), i)
+                results.failures += 1
+        return results
+
+    def _execFailed(self, failure):
+        # the error which aborted the transaction, e.g. a command which
+        # could not be queued, rather than the FirstError wrapping it
+        failure.trap(FirstError)
+        return failure.value.subFailure
+
+    def discard_pipeline(self):
+        """
+        Leave the pipeline without sending any of its commands. Their replies
+        are no longer expected, so Deferreds obtained for them never fire.
+        """
+        if not self.pipelining:
+            raise RedisError("Not currently pipelining commands")
+        pipeline = self.pipelined_replies
+        for i in xrange(len(pipeline.results)):
+            self.replyQueue.waiting.pop()
+            if self.typedReplies:
+                self._decoders.pop()
+            if self.trackLatency:
+                self._sentTimes.pop()
+        self.pipelining = False
+        self.pipelined_commands = []
+        self.pipelined_replies = None
+        if pipeline.transaction:
+            self.post_proc = []
+            self.inTransaction = False
+        if not self.replyQueue.waiting:
+            self._drained()
+
+    def stream_pipeline(self, commands, callback=None, max_commands=1000,
+                        max_bytes=65536, max_unacked=10000):
+        """
+        Pipeline an unbounded iterable of commands, each a tuple of a command
+        name and its arguments, keeping up to max_unacked of them in flight.
+        Commands are written every max_commands commands or max_bytes bytes,
+        and callback(index, reply) is called with each reply as it arrives.
+
+        Return a Deferred which fires with the PipelineStream, counting the
+        commands ``sent`` and their ``failures``, once every reply is in.
+        """
+        if self.pipelining:
+            return fail(RedisError("Already pipelining commands"))
+        stream = PipelineStream(
+            self, commands, callback, max_commands, max_bytes, max_unacked
+        )
+        return stream.start()
+
+    # Auto-pipelining
+    # Commands issued during the same reactor iteration are buffered and
+    # written with a single transport.writeSequence() once the iteration is
+    # over, or as soon as AUTOPIPELINE_MAX_BYTES have been buffered.
+    def _autopipeline(self, command):
+        self.autopipelined_commands.extend(command)
+        for segment in command:
+            self.autopipelined_bytes += len(segment)
+        if self.autopipelined_bytes >= self.AUTOPIPELINE_MAX_BYTES:
+            self.flush_autopipeline()
+        elif self._autopipeline_call is None:
+            self._autopipeline_call = reactor.callLater(
+                0, self.flush_autopipeline
+            )
+
+    def flush_autopipeline(self):
+        """
+        Write all of the auto-pipelined commands to redis at once.
+        """
+        call, self._autopipeline_call = self._autopipeline_call, None
+        if call is not None and call.active():
+            call.cancel()
+
+        if self.autopipelined_commands:
+            data = self.autopipelined_commands
+            self.autopipelined_commands = []
+            self.autopipelined_bytes = 0
+            self.transport.writeSequence(data)
 
     # Publish/Subscribe
     # see the SubscriberProtocol for subscribing to channels
@@ -1047,40 +1259,41 @@ class RedisApiMixin():
         """
         Publish message to a channel
         """
-        return self.execute_command("PUBLISH", channel, message)
+        return self.execute_command(
+            "PUBLISH", channel, message, decoder=INTEGER)
 
     # Persistence control commands
     def save(self):
         """
         Synchronously save the DB on disk
         """
-        return self.execute_command("SAVE")
+        return self.execute_command("SAVE", decoder=TEXT)
 
     def bgsave(self):
         """
         Asynchronously save the DB on disk
         """
-        return self.execute_command("BGSAVE")
+        return self.execute_command("BGSAVE", decoder=TEXT)
 
     def lastsave(self):
         """
         Return the UNIX time stamp of the last successfully saving of the
         dataset on disk
         """
-        return self.execute_command("LASTSAVE")
+        return self.execute_command("LASTSAVE", decoder=INTEGER)
 
     def shutdown(self):
         """
         Synchronously save the DB on disk, then shutdown the server
         """
         self.factory.continueTrying = False
-        return self.execute_command("SHUTDOWN")
+        return self.execute_command("SHUTDOWN", decoder=TEXT)
 
     def bgrewriteaof(self):
         """
         Rewrite the append only file in background when it gets too big
         """
-        return self.execute_command("BGREWRITEAOF")
+        return self.execute_command("BGREWRITEAOF", decoder=TEXT)
 
     def _process_info(self, r):
         keypairs = [x for x in r.split('\r\n') if
@@ -1097,9 +1310,9 @@ class RedisApiMixin():
         Provide information and statistics about the server
         """
         if type is None:
-            return self.execute_command("INFO")
+            return self.execute_command("INFO", decoder=TEXT)
         else:
-            r = self.execute_command("INFO", type)
+            r = self.execute_command("INFO", type, decoder=TEXT)
             return r.addCallback(self._process_info)
 
     # slaveof is missing
@@ -1158,15 +1371,16 @@ class RedisApiMixin():
     def script_exists(self, *hashes):
         return self.execute_command("SCRIPT", "EXISTS",
                                     post_proc=self._script_exists_success,
-                                    *hashes)
+                                    decoder=INTEGER, *hashes)
 
     def _script_flush_success(self, r):
         self.script_hashes.clear()
         return r
 
     def script_flush(self):
-        return self.execute_command("SCRIPT", "FLUSH").addCallback(
-            self._script_flush_success)
+        return self.execute_command(
+            "SCRIPT", "FLUSH", decoder=TEXT
+        ).addCallback(self._script_flush_success)
 
     def _handle_script_kill(self, r):
         if isinstance(r, Failure):
@@ -1178,21 +1392,23 @@ class RedisApiMixin():
         return r
 
     def script_kill(self):
-        return self.execute_command("SCRIPT",
-                                    "KILL").addBoth(self._handle_script_kill)
+        return self.execute_command(
+            "SCRIPT", "KILL", decoder=TEXT
+        ).addBoth(self._handle_script_kill)
 
     def script_load(self, script):
-        return self.execute_command("SCRIPT",  "LOAD", script)
+        return self.execute_command("SCRIPT",  "LOAD", script, decoder=TEXT)
 
     # Redis 2.8.9 HyperLogLog commands
     def pfadd(self, key, elements, *args):
         elements = list_or_args("pfadd", elements, args)
-        return self.execute_command("PFADD", key, *elements)
+        return self.execute_command("PFADD", key, *elements, decoder=INTEGER)
 
     def pfcount(self, keys, *args):
         keys = list_or_args("pfcount", keys, args)
-        return self.execute_command("PFCOUNT", *keys)
+        return self.execute_command("PFCOUNT", *keys, decoder=INTEGER)
 
     def pfmerge(self, destKey, sourceKeys, *args):
         sourceKeys = list_or_args("pfmerge", sourceKeys, args)
-        return self.execute_command("PFMERGE", destKey, *sourceKeys)
+        return self.execute_command(
+            "PFMERGE", destKey, *sourceKeys, decoder=TEXT)
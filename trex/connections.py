@@ -1,13 +1,122 @@
+import array
 import bisect
 import collections
 import functools
+import hashlib
+import heapq
+import itertools
+import math
 import operator
+import random
 import re
 import zlib
 
-from .exceptions import ConnectionError
+from .decoding import TEXT
+from .exceptions import ConnectionError, ShardError, TimeoutError, WatchError
 from .utils import list_or_args
-from twisted.internet.defer import inlineCallbacks, returnValue, DeferredList
+from twisted.python.failure import Failure
+from twisted.internet.defer import (
+    inlineCallbacks, returnValue, CancelledError, Deferred, DeferredList,
+    fail, maybeDeferred
+)
+
+
+# Methods which block on the server until data is available.
+BlockingMethods = frozenset([
+    "blpop",
+    "brpop",
+    "brpoplpush",
+])
+
+# Methods which need a pooled connection to themselves until their reply
+# arrives (or until the transaction or pipeline they start is finished).
+ExclusiveMethods = BlockingMethods | frozenset([
+    "multi",
+    "pipeline",
+    "stream_pipeline",
+    "watch",
+])
+
+# Exclusive methods which put the connection into a transactional state.
+TransactionMethods = frozenset([
+    "multi",
+    "watch",
+])
+
+
+# Methods which can be sent twice without harm, e.g. when the connection
+# is lost before their reply arrives; the only ones buffered while offline
+# with the "idempotent" policy.
+IdempotentMethods = frozenset([
+    "delete",
+    "exists",
+    "expire",
+    "get",
+    "get_type",
+    "getbit",
+    "getrange",
+    "hexists",
+    "hget",
+    "hgetall",
+    "hkeys",
+    "hlen",
+    "hmget",
+    "hmset",
+    "hset",
+    "hvals",
+    "keys",
+    "lindex",
+    "llen",
+    "lrange",
+    "mget",
+    "mset",
+    "persist",
+    "ping",
+    "pttl",
+    "sadd",
+    "scard",
+    "set",
+    "setex",
+    "sismember",
+    "smembers",
+    "srem",
+    "strlen",
+    "ttl",
+    "zadd",
+    "zcard",
+    "zcount",
+    "zrange",
+    "zrangebyscore",
+    "zrank",
+    "zrem",
+    "zrevrange",
+    "zrevrangebyscore",
+    "zrevrank",
+    "zscore",
+])
+
+
+def argsSize(args):
+    """
+    Roughly the number of bytes taken by the arguments of a command.
+    """
+    size = 0
+    for arg in args:
+        if isinstance(arg, (bytes, unicode, bytearray, memoryview)):
+            size += len(arg)
+        elif isinstance(arg, dict):
+            size += argsSize(arg.keys()) + argsSize(arg.values())
+        elif isinstance(arg, (list, tuple, set, frozenset)):
+            size += argsSize(arg)
+        else:
+            size += 8
+    return size
+
+
+def switch_to_errback(reply):
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
 
 
 class ConnectionHandler(object):
@@ -16,43 +125,227 @@ class ConnectionHandler(object):
         self._connected = factory.deferred
 
     def disconnect(self):
-        self._factory.continueTrying = 0
-        for conn in self._factory.pool:
+        self._factory.disconnect()
+        self._factory.failOffline(ConnectionError("Disconnected"))
+        d = self._factory.waitForEmptyPool()
+        if self._factory.blockingFactory is not None:
+            d = DeferredList([
+                d, self._factory.blockingFactory.handler.disconnect()
+            ])
+            d.addCallback(lambda _: None)
+        return d
+
+    @inlineCallbacks
+    def transaction(self, func, watch_keys=None, max_retries=10,
+                    backoff=0.01):
+        """
+        Run func(connection) as an optimistically locked transaction.
+
+        watch_keys are WATCHed on a pooled connection, which func may read
+        from before queueing its writes on connection.pipeline(
+        transaction=True). They are all sent at once within MULTI and EXEC.
+        If a watched key changed in the meantime, the transaction is retried
+        after a jittered backoff doubling from ``backoff`` seconds, and fails
+        with WatchError after max_retries retries.
+
+        Returns a Deferred firing with the EXEC results, or None if func did
+        not pipeline any command. The factory counts the retries in
+        transactionRetries and the failed transactions in transactionsFailed.
+        """
+        keys = [] if watch_keys is None else \
+            list_or_args("transaction", watch_keys, [])
+        retries = 0
+        while True:
+            connection = yield self._factory.getConnection()
             try:
-                conn.transport.loseConnection()
-            except:
-                pass
+                results = yield self._transaction(connection, func, keys)
+            except WatchError:
+                if retries >= max_retries:
+                    self._factory.transactionsFailed += 1
+                    raise
+                self._factory.transactionRetries += 1
+                delay = backoff * 2 ** retries * random.uniform(0.5, 1.0)
+                retries += 1
+                yield self._sleep(delay)
+            else:
+                returnValue(results)
+
+    @inlineCallbacks
+    def _transaction(self, connection, func, keys):
+        # the connection goes back to the pool once EXEC replies, or here
+        # if func fails or has nothing to write.
+        try:
+            if connection.outstanding:
+                yield connection.whenDrained()
+            if keys:
+                yield connection.execute_command(
+                    "WATCH", *keys, decoder=TEXT
+                )
+            yield maybeDeferred(func, connection)
+        except Exception:
+            failure = Failure()
+            if connection.pipelining:
+                connection.discard_pipeline()
+            yield self._release(connection, keys)
+            failure.raiseException()
+
+        if not connection.pipelining:
+            yield self._release(connection, keys)
+            returnValue(None)
+        transactional = connection.pipelined_replies.transaction
+        d = connection.execute_pipeline()
+        if keys and not transactional and connection.connected:
+            # no EXEC to clear the watched keys
+            connection.execute_command("UNWATCH", decoder=TEXT)
+        results = yield d
+        returnValue(results)
 
-        return self._factory.waitForEmptyPool()
+    @inlineCallbacks
+    def _release(self, connection, keys):
+        try:
+            if keys and connection.connected:
+                yield connection.execute_command("UNWATCH", decoder=TEXT)
+        except Exception:
+            # a connection which cannot UNWATCH is lost, and is discarded
+            # by the pool
+            pass
+        finally:
+            self._factory.connectionQueue.put(connection)
+
+    def _sleep(self, delay):
+        d = Deferred()
+        timers = self._factory.timers
+        timers.add(timers.seconds() + delay, d.callback, None)
+        return d
 
     def __getattr__(self, method):
-        def wrapper(*args, **kwargs):
-            d = self._factory.getConnection()
-
-            def callback(connection):
-                protocol_method = getattr(connection, method)
-                try:
-                    d = protocol_method(*args, **kwargs)
-                except:
-                    self._factory.connectionQueue.put(connection)
-                    raise
+        # the wrapper is built once per method name and cached on the
+        # handler, so that later lookups never get here.
+        if method.startswith("__"):
+            raise AttributeError(method)
+        if method in BlockingMethods and self._factory.blockingPoolsize:
+            def wrapper(*args, **kwargs):
+                handler = self._factory.getBlockingFactory().handler
+                return getattr(handler, method)(*args, **kwargs)
+        else:
+            wrapper = functools.partial(self._dispatch, method)
+        self.__dict__[method] = wrapper
+        return wrapper
 
-                def put_back(reply):
-                    if not connection.inTransaction:
-                        self._factory.connectionQueue.put(connection)
-                    return reply
+    def _dispatch(self, method, *args, **kwargs):
+        factory = self._factory
+        timeout = kwargs.pop("commandTimeout", None)
+        if timeout is None and method not in BlockingMethods:
+            timeout = factory.commandTimeout
+        if timeout is not None:
+            deadline = factory.timers.seconds() + timeout
+        else:
+            deadline = None
+        decodeResponses = kwargs.pop("decodeResponses", None)
+        command = (method, args, kwargs, deadline, decodeResponses)
 
-                def switch_to_errback(reply):
-                    if isinstance(reply, Exception):
-                        raise reply
-                    return reply
+        if not factory.size and factory.offlinePolicy is not None and \
+                factory.continueTrying:
+            return self._offline(command)
 
-                d.addBoth(put_back)
-                d.addCallback(switch_to_errback)
-                return d
-            d.addCallback(callback)
+        if factory.multiplex and method not in ExclusiveMethods:
+            d = self._withDeadline(
+                factory.getSharedConnection(), deadline, method
+            )
+            d.addCallback(self._shared, command)
             return d
-        return wrapper
+
+        d = self._withDeadline(factory.getConnection(), deadline, method)
+        d.addCallback(self._exclusive, command)
+        return d
+
+    def _offline(self, command):
+        method, args, kwargs, deadline = command[:4]
+        policy = self._factory.offlinePolicy
+        if policy == "fail" or method in ExclusiveMethods or (
+                policy == "idempotent" and method not in IdempotentMethods):
+            return fail(ConnectionError(
+                "Not connected, could not send '%s'" % method
+            ))
+        return self._factory.bufferCommand(
+            functools.partial(self._call, command=command),
+            argsSize(args) + argsSize(kwargs.values()), deadline
+        )
+
+    def _call(self, connection, command):
+        method, args, kwargs, deadline, decodeResponses = command
+        if deadline is not None and \
+                deadline <= self._factory.timers.seconds():
+            raise TimeoutError(
+                "Timed out waiting for a connection to send '%s'" % method
+            )
+        connection.deadline = deadline
+        decode = connection.decodeResponses
+        if decodeResponses is not None:
+            connection.decodeResponses = decodeResponses
+        try:
+            return getattr(connection, method)(*args, **kwargs)
+        finally:
+            connection.deadline = None
+            connection.decodeResponses = decode
+
+    def _shared(self, connection, command):
+        d = self._call(connection, command)
+        d.addCallback(switch_to_errback)
+        return d
+
+    def _exclusive(self, connection, command):
+        method, args, kwargs = command[:3]
+        transactional = method in TransactionMethods or (
+            method == "pipeline" and kwargs.get("transaction")
+        )
+        if transactional and connection.outstanding:
+            # replies to commands multiplexed on to this connection
+            # must not be mistaken for replies within the transaction
+            d = connection.whenDrained()
+            d.addCallback(self._exclusive, command)
+            return d
+
+        try:
+            d = self._call(connection, command)
+        except:
+            self._factory.connectionQueue.put(connection)
+            raise
+
+        if connection.autopipeline and not connection.inTransaction \
+                and method not in ExclusiveMethods:
+            # the command has been buffered on the connection and its
+            # reply will come back in order, so the connection can be
+            # handed straight to the next caller in this iteration.
+            self._factory.connectionQueue.put(connection)
+            d.addCallback(switch_to_errback)
+            return d
+
+        d.addBoth(self._putBack, connection)
+        d.addCallback(switch_to_errback)
+        return d
+
+    def _putBack(self, reply, connection):
+        if not (connection.inTransaction or connection.pipelining):
+            self._factory.connectionQueue.put(connection)
+        return reply
+
+    def _withDeadline(self, d, deadline, method):
+        # stop waiting for a pooled connection once the deadline passes;
+        # once sent, the command times out on the connection itself.
+        if deadline is None or d.called:
+            return d
+        timer = self._factory.timers.add(deadline, d.cancel)
+        d.addBoth(self._timedOut, timer, method)
+        return d
+
+    def _timedOut(self, reply, timer, method):
+        self._factory.timers.cancel(timer)
+        if isinstance(reply, Failure) and reply.check(CancelledError):
+            raise TimeoutError(
+                "Timed out waiting for a connection to send '%s'" % method
+            )
+        return reply
 
     def __repr__(self):
         try:
@@ -79,8 +372,6 @@ class UnixConnectionHandler(ConnectionHandler):
 
 ShardedMethods = frozenset([
     "decr",
-    "delete",
-    "exists",
     "expire",
     "get",
     "get_type",
@@ -135,69 +426,333 @@ ShardedMethods = frozenset([
 
 _findhash = re.compile(r'.+\{(.*)\}.*')
 
+# the smallest array typecode holding unsigned 32 bit hash points
+_POINT = "I" if array.array("I").itemsize >= 4 else "L"
 
-class HashRing(object):
-    """Consistent hash for redis API"""
-    def __init__(self, nodes=[], replicas=160):
-        self.nodes = []
-        self.replicas = replicas
-        self.ring = {}
-        self.sorted_keys = []
 
-        for n in nodes:
-            self.add_node(n)
+def _check_weight(weight):
+    if not weight > 0:
+        raise ValueError(
+            "Node weights must be positive, not %s" % repr(weight)
+        )
+
+
+def _mix64(h):
+    # the finalizer of MurmurHash3, spreading a 32 bit hash over 64 bits
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & 0xffffffffffffffff
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & 0xffffffffffffffff
+    h ^= h >> 33
+    return h
+
+
+def _key_bytes(key):
+    if isinstance(key, unicode):
+        return key.encode("utf-8")
+    return key
+
 
-    def add_node(self, node):
+class Placement(object):
+    """
+    How keys are placed on shards, nodes getting a share of the keys
+    proportional to their ``weights``. Subclasses define get_node(key),
+    returning the node of ``nodes`` which key belongs to, or None if there
+    are no nodes.
+    """
+    def __init__(self, nodes=[], weights=None):
+        self.nodes = []
+        self.weights = []
+        if weights is None:
+            weights = [1] * len(nodes)
+        for n, w in zip(nodes, weights):
+            self.add_node(n, w)
+
+    def add_node(self, node, weight=1):
+        _check_weight(weight)
         self.nodes.append(node)
-        for x in xrange(self.replicas):
-            crckey = zlib.crc32("%s:%d" % (node._factory.uuid, x))
-            self.ring[crckey] = node
-            self.sorted_keys.append(crckey)
+        self.weights.append(weight)
+
+    def remove_node(self, node):
+        index = self.nodes.index(node)
+        del self.nodes[index]
+        del self.weights[index]
+
+    def set_weight(self, node, weight):
+        _check_weight(weight)
+        self.weights[self.nodes.index(node)] = weight
+
+    def distribution(self, keys):
+        """
+        Return a list of (node, expected, actual) tuples giving the share of
+        the keys each node should get according to its weight, and the share
+        of the given sample of keys it does get.
+        """
+        counts = [0] * len(self.nodes)
+        total = 0
+        for key in keys:
+            counts[self.nodes.index(self.get_node(key))] += 1
+            total += 1
+        weight = float(sum(self.weights))
+        return [
+            (node, w / weight, float(count) / total if total else 0.0)
+            for node, w, count in zip(self.nodes, self.weights, counts)
+        ]
+
+    def __call__(self, key):
+        return self.get_node(key)
 
-        self.sorted_keys.sort()
+
+class HashRing(Placement):
+    """
+    Consistent hash for redis API.
+
+    The points of the ring are kept sorted in a compact array, with a
+    parallel array of the index in ``nodes`` of the node owning each point.
+    Each node gets ``replicas`` points per unit of weight, the crc32 of
+    "<uuid>:<n>", and so a share of the keys proportional to its weight.
+    With ketama=True, points and keys are hashed with MD5 as libketama does
+    instead, so that keys land on the same nodes as with other ketama
+    clients (given the same uuids and equal weights).
+    """
+    def __init__(self, nodes=[], replicas=160, ketama=False, weights=None):
+        self.replicas = replicas
+        self.ketama = ketama
+        self.points = array.array(_POINT)
+        self.owners = array.array(_POINT)
+        Placement.__init__(self, nodes, weights)
+
+    def _node_points(self, node, weight):
+        name = node._factory.uuid
+        if not self.ketama:
+            return sorted(
+                zlib.crc32("%s:%d" % (name, x)) & 0xffffffff
+                for x in xrange(int(round(self.replicas * weight)))
+            )
+        points = []
+        for x in xrange(int(round(self.replicas * weight / 4.0))):
+            digest = bytearray(hashlib.md5("%s-%d" % (name, x)).digest())
+            for h in xrange(4):
+                points.append(
+                    digest[3 + h * 4] << 24 | digest[2 + h * 4] << 16 |
+                    digest[1 + h * 4] << 8 | digest[h * 4]
+                )
+        points.sort()
+        return points
+
+    def _merge(self, points, index):
+        # the node's points are merged into the ring, already sorted
+        merged = heapq.merge(
+            itertools.izip(self.points, self.owners),
+            ((point, index) for point in points)
+        )
+        ring, owners = array.array(_POINT), array.array(_POINT)
+        for point, owner in merged:
+            ring.append(point)
+            owners.append(owner)
+        self.points, self.owners = ring, owners
+
+    def _drop(self, index):
+        # remove the points of nodes[index], and shift the index of the
+        # nodes after it
+        ring, owners = array.array(_POINT), array.array(_POINT)
+        for point, owner in itertools.izip(self.points, self.owners):
+            if owner != index:
+                ring.append(point)
+                owners.append(owner - 1 if owner > index else owner)
+        self.points, self.owners = ring, owners
+
+    def add_node(self, node, weight=1):
+        Placement.add_node(self, node, weight)
+        self._merge(self._node_points(node, weight), len(self.nodes) - 1)
 
     def remove_node(self, node):
-        self.nodes.remove(node)
-        for x in xrange(self.replicas):
-            crckey = zlib.crc32("%s:%d" % (node, x))
-            self.ring.remove(crckey)
-            self.sorted_keys.remove(crckey)
+        index = self.nodes.index(node)
+        Placement.remove_node(self, node)
+        self._drop(index)
+
+    def set_weight(self, node, weight):
+        """
+        Give node a share of the keys proportional to weight.
+        """
+        _check_weight(weight)
+        index = self.nodes.index(node)
+        if self.weights[index] == weight:
+            return
+        self.weights[index] = weight
+        ring, owners = array.array(_POINT), array.array(_POINT)
+        for point, owner in itertools.izip(self.points, self.owners):
+            if owner != index:
+                ring.append(point)
+                owners.append(owner)
+        self.points, self.owners = ring, owners
+        self._merge(self._node_points(node, weight), index)
+
+    def hash(self, key):
+        key = _key_bytes(key)
+        if not self.ketama:
+            return zlib.crc32(key) & 0xffffffff
+        digest = bytearray(hashlib.md5(key).digest())
+        return digest[3] << 24 | digest[2] << 16 | digest[1] << 8 | digest[0]
 
     def get_node(self, key):
         n, i = self.get_node_pos(key)
         return n
 
     def get_node_pos(self, key):
-        if len(self.ring) == 0:
+        points = self.points
+        if not points:
             return [None, None]
-        crc = zlib.crc32(key)
-        idx = bisect.bisect(self.sorted_keys, crc)
-        # prevents out of range index
-        idx = min(idx, (self.replicas * len(self.nodes)) - 1)
-        return [self.ring[self.sorted_keys[idx]], idx]
+        h = self.hash(key)
+        # ketama picks the first point at or after the key's hash
+        if self.ketama:
+            idx = bisect.bisect_left(points, h)
+        else:
+            idx = bisect.bisect_right(points, h)
+        if idx == len(points):
+            idx = 0
+        return [self.nodes[self.owners[idx]], idx]
 
     def iter_nodes(self, key):
-        if len(self.ring) == 0:
+        if not self.points:
             yield None, None
+            return
         node, pos = self.get_node_pos(key)
-        for k in self.sorted_keys[pos:]:
-            yield k, self.ring[k]
+        for i in xrange(pos, len(self.points)):
+            yield self.points[i], self.nodes[self.owners[i]]
+
+
+class JumpHash(Placement):
+    """
+    Jump consistent hash (Lamping and Veach): no memory beyond the list of
+    buckets and a near perfect balance. A node gets a bucket per unit of
+    weight, rounded. Adding a node only moves keys to it, but removing a
+    node other than the last one added also moves keys between the others.
+    """
+    def __init__(self, nodes=[], weights=None):
+        self.buckets = []
+        Placement.__init__(self, nodes, weights)
+
+    def _build(self):
+        self.buckets = []
+        for node, weight in zip(self.nodes, self.weights):
+            self.buckets.extend([node] * max(int(round(weight)), 1))
+
+    def add_node(self, node, weight=1):
+        Placement.add_node(self, node, weight)
+        self.buckets.extend([node] * max(int(round(weight)), 1))
 
-    def __call__(self, key):
-        return self.get_node(key)
+    def remove_node(self, node):
+        Placement.remove_node(self, node)
+        self._build()
+
+    def set_weight(self, node, weight):
+        Placement.set_weight(self, node, weight)
+        self._build()
+
+    def get_node(self, key):
+        n = len(self.buckets)
+        if not n:
+            return None
+        h = _mix64(zlib.crc32(_key_bytes(key)) & 0xffffffff)
+        b, j = -1, 0
+        while j < n:
+            b = j
+            h = (h * 2862933555777941757 + 1) & 0xffffffffffffffff
+            j = int((b + 1) * (2147483648.0 / ((h >> 33) + 1)))
+        return self.buckets[b]
+
+
+class RendezvousHash(Placement):
+    """
+    Weighted rendezvous (highest random weight) hashing: each key goes to
+    the node with the highest score -weight / ln(h), h being a hash of the
+    key and the node's uuid in (0, 1). Adding or removing a node only moves
+    the keys of that node, at the cost of hashing the key once per node.
+    """
+    def __init__(self, nodes=[], weights=None):
+        self.seeds = []
+        Placement.__init__(self, nodes, weights)
+
+    def add_node(self, node, weight=1):
+        Placement.add_node(self, node, weight)
+        self.seeds.append(zlib.crc32(node._factory.uuid))
+
+    def remove_node(self, node):
+        index = self.nodes.index(node)
+        Placement.remove_node(self, node)
+        del self.seeds[index]
+
+    def get_node(self, key):
+        key = _key_bytes(key)
+        best, node = None, None
+        for n, weight, seed in zip(self.nodes, self.weights, self.seeds):
+            h = _mix64(zlib.crc32(key, seed) & 0xffffffff)
+            score = -weight / math.log((h + 0.5) / 18446744073709551616.0)
+            if best is None or score > best:
+                best, node = score, n
+        return node
+
+
+PLACEMENTS = {
+    "ring": HashRing,
+    "ketama": functools.partial(HashRing, ketama=True),
+    "jump": JumpHash,
+    "rendezvous": RendezvousHash,
+}
+
+
+def get_placement(placement):
+    """
+    Return the placement class for ``placement``, which is either one of the
+    names in PLACEMENTS, a callable taking the nodes and a ``weights``
+    keyword argument, or None for the default (the crc32 ring).
+    """
+    if placement is None:
+        return HashRing
+    if isinstance(placement, basestring):
+        try:
+            return PLACEMENTS[placement.lower()]
+        except KeyError:
+            raise ValueError(
+                "Unknown shard placement %s" % repr(placement)
+            )
+    if not callable(placement):
+        raise ValueError(
+            "A shard placement must be a name or a callable, not %s" %
+            repr(placement)
+        )
+    return placement
 
 
 class ShardedConnectionHandler(object):
-    def __init__(self, connections):
+    """
+    Spread keys over several redis servers.
+
+    Commands on several keys (mget, mset, delete, exists, unlink) are split
+    into one command per shard, sent concurrently. They are only atomic
+    within a shard: if some shards fail, the others will have carried out
+    their part, and ShardError reports both. msetnx, whose point is to be
+    atomic, only takes keys of a single shard, e.g. sharing a {hash tag}.
+    """
+    # the most keys fetched from a shard by a single MGET
+    MGET_BATCH_SIZE = 1000
+
+    def __init__(self, connections, ketama=False, weights=None,
+                 placement=None):
+        if ketama and placement is None:
+            placement = "ketama"
+        self._placement = get_placement(placement)
+        self._weights = weights
         if isinstance(connections, DeferredList):
             self._ring = None
             connections.addCallback(self._makeRing)
         else:
-            self._ring = HashRing(connections)
+            self._ring = self._placement(connections, weights=weights)
 
     def _makeRing(self, connections):
         connections = map(operator.itemgetter(1), connections)
-        self._ring = HashRing(connections)
+        self._ring = self._placement(connections, weights=self._weights)
         return self
 
     @inlineCallbacks
@@ -217,13 +772,14 @@ class ShardedConnectionHandler(object):
             raise ValueError(
                 "Method '%s' requires a key as the first argument" % method)
 
+        return getattr(self._node(key), method)(*args, **kwargs)
+
+    def _node(self, key):
+        # keys with a {hash tag} are placed by their tag alone
         m = _findhash.match(key)
         if m is not None and len(m.groups()) >= 1:
-            node = self._ring(m.groups()[0])
-        else:
-            node = self._ring(key)
-
-        return getattr(node, method)(*args, **kwargs)
+            return self._ring(m.groups()[0])
+        return self._ring(key)
 
     def pipeline(self):
         raise NotImplementedError("Pipelining is not supported across shards")
@@ -235,29 +791,143 @@ class ShardedConnectionHandler(object):
             raise NotImplementedError("Method '%s' cannot be sharded" % method)
 
     @inlineCallbacks
-    def mget(self, keys, *args):
+    def mget(self, keys, *args, **kwargs):
         """
         high-level mget, required because of the sharding support
-        """
 
+        Keys are grouped by shard and fetched with concurrent MGETs of up to
+        MGET_BATCH_SIZE keys each; the values are returned in the order of
+        the keys. If some shards fail, ShardError is raised with their
+        failures, and the values from the other shards in its results (None
+        for the keys of failed shards).
+        """
         keys = list_or_args("mget", keys, args)
-        group = collections.defaultdict(lambda: [])
-        for k in keys:
-            node = self._ring(k)
-            group[node].append(k)
-
-        deferreds = []
-        for node, keys in group.items():
-            nd = node.mget(keys)
-            deferreds.append(nd)
-
-        result = []
-        response = yield DeferredList(deferreds)
-        for (success, values) in response:
+        batch = kwargs.pop("batch_size", self.MGET_BATCH_SIZE)
+
+        group = self._group(keys)
+        batches = []
+        for node, positions in group.items():
+            for start in xrange(0, len(positions), batch):
+                batches.append((node, positions[start:start + batch]))
+
+        result = [None] * len(keys)
+        failures = {}
+        response = yield self._scatter("mget", [
+            (node, [keys[i] for i in chunk]) for node, chunk in batches
+        ], **kwargs)
+        for (node, chunk), (success, values) in zip(batches, response):
+            if not success:
+                failures.setdefault(node, values)
+                continue
+            for i, value in zip(chunk, values):
+                result[i] = value
+
+        if failures:
+            raise ShardError(
+                "mget failed on %d of %d shard(s)" % (
+                    len(failures), len(group)
+                ), failures, result
+            )
+        returnValue(result)
+
+    def _group(self, keys):
+        # the positions of the keys of each shard
+        group = collections.defaultdict(list)
+        for i, k in enumerate(keys):
+            group[self._node(k)].append(i)
+        return group
+
+    def _scatter(self, method, calls, **kwargs):
+        """
+        Call method(arg, **kwargs) on the node of each (node, arg) of calls
+        concurrently, returning a DeferredList of the outcomes.
+        """
+        return DeferredList([
+            getattr(node, method)(arg, **kwargs) for node, arg in calls
+        ], consumeErrors=True)
+
+    @inlineCallbacks
+    def _count(self, method, keys, args):
+        # run a command returning a count of keys on every shard, and add
+        # up the counts
+        keys = list_or_args(method, keys, args)
+        calls = [
+            (node, [keys[i] for i in positions])
+            for node, positions in self._group(keys).items()
+        ]
+        total = 0
+        failures = {}
+        response = yield self._scatter(method, calls)
+        for (node, arg), (success, count) in zip(calls, response):
             if success:
-                result += values
+                total += count
+            else:
+                failures[node] = count
+        if failures:
+            raise ShardError(
+                "%s failed on %d of %d shard(s)" % (
+                    method, len(failures), len(calls)
+                ), failures, total
+            )
+        returnValue(total)
 
-        returnValue(result)
+    def delete(self, keys, *args):
+        """
+        Delete keys from every shard, returning how many were deleted.
+        """
+        return self._count("delete", keys, args)
+
+    def unlink(self, keys, *args):
+        """
+        Unlink keys from every shard, returning how many were unlinked.
+        """
+        return self._count("unlink", keys, args)
+
+    def exists(self, keys, *args):
+        """
+        Return how many of the keys exist across the shards.
+        """
+        return self._count("exists", keys, args)
+
+    @inlineCallbacks
+    def mset(self, mapping):
+        """
+        Set keys to values with one MSET per shard, returning True once all
+        of them are set. If some shards fail, ShardError is raised with the
+        keys set on the others in its results.
+        """
+        group = collections.defaultdict(dict)
+        for k, v in mapping.iteritems():
+            group[self._node(k)][k] = v
+        calls = group.items()
+
+        written = []
+        failures = {}
+        response = yield self._scatter("mset", calls)
+        for (node, items), (success, reply) in zip(calls, response):
+            if success:
+                written.extend(items)
+            else:
+                failures[node] = reply
+        if failures:
+            raise ShardError(
+                "mset failed on %d of %d shard(s)" % (
+                    len(failures), len(calls)
+                ), failures, written
+            )
+        returnValue(True)
+
+    def msetnx(self, mapping):
+        """
+        Set keys to values unless any of them exists. Being atomic, this
+        needs all of the keys to be on a single shard.
+        """
+        nodes = set(self._node(k) for k in mapping)
+        if len(nodes) != 1:
+            raise ValueError(
+                "msetnx requires keys of a single shard, not %d" % len(nodes)
+            )
+        return nodes.pop().msetnx(mapping)
 
     def __repr__(self):
         nodes = []
@@ -0,0 +1,236 @@
+"""
+Decoding of replies.
+
+Every command declares how its reply is decoded, by passing one of the
+decoders below as the ``decoder`` keyword of execute_command(). A decoder is
+called with the reply as parsed by hiredis (a str, an int, None, an error or
+a list of those) and the connection's charset.
+
+AUTO is the historical behaviour, and the default: strings which look like
+numbers become ints or floats and the others are decoded with the charset.
+Commands whose reply type is known skip that guessing altogether.
+
+Decoders with ``text`` set let the hiredis reader decode strings with the
+charset in C, the decoder then only sees unicode. Strings which cannot be
+decoded are put back as bytes by restore(), as the Python decoding would
+have left them.
+"""
+import codecs
+import os
+import string
+
+
+# Possible first characters in a string containing an integer or a float.
+_NUM_FIRST_CHARS = frozenset(string.digits + "+-.")
+
+
+def _auto(data, charset):
+    if type(data) is not str:
+        return data
+    if data and data[0] in _NUM_FIRST_CHARS:  # Most likely a number
+        try:
+            return int(data) if data.find('.') == -1 else float(data)
+        except ValueError:
+            pass
+    if charset is not None:
+        try:
+            return data.decode(charset)
+        except UnicodeDecodeError:
+            pass
+    return data
+
+
+def _number(data, charset):
+    # _auto() for strings the reader has decoded already, or failed to.
+    t = type(data)
+    if (t is unicode or t is str) and data and data[0] in _NUM_FIRST_CHARS:
+        try:
+            return int(data) if data.find('.') == -1 else float(data)
+        except ValueError:
+            pass
+    return data
+
+
+def _text(data, charset):
+    if type(data) is str and charset is not None:
+        try:
+            return data.decode(charset)
+        except UnicodeDecodeError:
+            pass
+    return data
+
+
+def _integer(data, charset):
+    if type(data) is str:
+        return int(data)
+    return data
+
+
+def _float(data, charset):
+    if type(data) is str:
+        return float(data)
+    return data
+
+
+class Decoder(object):
+    """
+    Apply convert(data, charset) to a reply, or to each element of a
+    multi-bulk reply.
+
+    When ``decoded`` is given the reader may decode the strings of the reply,
+    which are then converted with decoded(data, charset) instead; None means
+    there is nothing left to do.
+    """
+    def __init__(self, convert, decoded=False):
+        self.convert = convert
+        self.text = decoded is not False
+        self.decodedConvert = decoded
+
+    def __call__(self, reply, charset):
+        convert = self.convert
+        if type(reply) is list:
+            return [convert(x, charset) for x in reply]
+        return convert(reply, charset)
+
+    def decoded(self, reply, charset):
+        """
+        Decode a reply whose strings have already been decoded by the reader.
+        """
+        convert = self.decodedConvert
+        if convert is None:
+            return reply
+        if type(reply) is list:
+            return [convert(x, charset) for x in reply]
+        return convert(reply, charset)
+
+
+class RawDecoder(Decoder):
+    """
+    Leave replies as hiredis returned them.
+    """
+    def __init__(self):
+        Decoder.__init__(self, lambda data, charset: data)
+
+    def __call__(self, reply, charset):
+        return reply
+
+
+class PairsDecoder(Decoder):
+    """
+    Decode the elements of a flat list of pairs (field, value, ...), the
+    first of each pair with ``first`` and the second with ``second``.
+    """
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+        self.text = first.text and second.text
+
+    def __call__(self, reply, charset):
+        return self._pairs(
+            reply, charset, self.first.convert, self.second.convert
+        )
+
+    def decoded(self, reply, charset):
+        return self._pairs(
+            reply, charset, self.first.decodedConvert,
+            self.second.decodedConvert
+        )
+
+    @staticmethod
+    def _pairs(reply, charset, first, second):
+        if type(reply) is not list:
+            return reply
+        if first is not None:
+            reply[::2] = [first(x, charset) for x in reply[::2]]
+        if second is not None:
+            reply[1::2] = [second(x, charset) for x in reply[1::2]]
+        return reply
+
+
+class ScanDecoder(Decoder):
+    """
+    Decode a SCAN family reply: the next cursor and a page of elements.
+    """
+    def __init__(self, elements):
+        self.elements = elements
+        self.text = elements.text
+
+    def __call__(self, reply, charset):
+        if type(reply) is not list:
+            return reply
+        cursor, elements = reply
+        return [int(cursor), self.elements(elements, charset)]
+
+    def decoded(self, reply, charset):
+        if type(reply) is not list:
+            return reply
+        cursor, elements = reply
+        return [int(cursor), self.elements.decoded(elements, charset)]
+
+
+AUTO = Decoder(_auto, decoded=_number)
+RAW = RawDecoder()
+TEXT = Decoder(_text, decoded=None)
+INTEGER = Decoder(_integer)
+FLOAT = Decoder(_float)
+
+# the reply to EXEC is decoded by the decoders of the queued commands
+EXEC = Decoder(_auto)
+
+
+def pairs(first, second):
+    return PairsDecoder(first, second)
+
+
+def scan(elements=RAW):
+    return ScanDecoder(elements)
+
+
+# Codec error handler for readers decoding strings: the strings which could
+# not be decoded are recorded, in order, and replaced by MARK. Readers are
+# driven one at a time, so a protocol claims what was recorded right after
+# each call to gets(); MARK then tells which elements of its reply failed,
+# as no string decoded successfully can end with it.
+FALLBACK = "trex.fallback"
+MARK = u"\ufffd" + u"".join(unichr(0xe000 + ord(c)) for c in os.urandom(8))
+
+undecodable = []
+
+
+def _fallback(e):
+    undecodable.append(e.object)
+    return MARK, len(e.object)
+
+
+codecs.register_error(FALLBACK, _fallback)
+
+
+def restore(reply, failed):
+    """
+    Put the strings of ``failed``, recorded while a reader using the FALLBACK
+    error handler decoded a reply, back into it as bytes. Each of them goes
+    to the next element of the reply ending with MARK. ``failed`` is emptied.
+    """
+    failed.reverse()
+    reply = _restore(reply, failed)
+    del failed[:]
+    return reply
+
+
+def _restore(reply, failed):
+    # failed is in reverse order, the next string to restore is last
+    t = type(reply)
+    if t is unicode:
+        if reply.endswith(MARK):
+            return failed.pop()
+    elif t is list:
+        for i, x in enumerate(reply):
+            if not failed:
+                break
+            t = type(x)
+            if t is unicode:
+                if x.endswith(MARK):
+                    reply[i] = failed.pop()
+            elif t is list:
+                reply[i] = _restore(x, failed)
+    return reply
@@ -0,0 +1,159 @@
+"""
+Encoding of commands into the redis unified request protocol.
+
+Headers which do not depend on user data are computed once up front: the
+array header for short commands, the whole bulk string for every command
+name trex sends and for small integers.
+
+Commands are encoded as a list of segments to be handed to
+transport.writeSequence(). Values of at least SEGMENT_MIN bytes are not
+copied into the command but written as segments of their own.
+
+Note that on python 2 "%s" % len(s) is more than twice as fast as "%d".
+"""
+import array
+
+from .exceptions import InvalidData
+
+
+COMMANDS = (
+    "APPEND", "AUTH", "BGREWRITEAOF", "BGSAVE", "BITCOUNT", "BITOP", "BLPOP",
+    "BRPOP", "BRPOPLPUSH", "DBSIZE", "DECRBY", "DEL", "DISCARD", "EVAL",
+    "EVALSHA", "EXEC", "EXISTS", "EXPIRE", "FLUSHALL", "FLUSHDB", "GET",
+    "GETBIT", "GETSET", "HDEL", "HEXISTS", "HGET", "HGETALL", "HINCRBY",
+    "HKEYS", "HLEN", "HMGET", "HMSET", "HSCAN", "HSET", "HSETNX", "HVALS",
+    "INCRBY", "INFO", "KEYS", "LASTSAVE", "LINDEX", "LLEN", "LPOP", "LPUSH",
+    "LRANGE", "LREM", "LSET", "LTRIM", "MGET", "MONITOR", "MOVE", "MSET",
+    "MSETNX", "MULTI", "PERSIST", "PFADD", "PFCOUNT", "PFMERGE", "PING",
+    "PSUBSCRIBE", "PUBLISH", "PUNSUBSCRIBE", "QUIT", "RANDOMKEY", "RENAME",
+    "RENAMENX", "RPOP", "RPOPLPUSH", "RPUSH", "SADD", "SAVE", "SCAN", "SCARD",
+    "SCRIPT", "SDIFF", "SDIFFSTORE", "SELECT", "SET", "SETBIT", "SETEX",
+    "SETNX", "SHUTDOWN", "SINTER", "SINTERSTORE", "SISMEMBER", "SMEMBERS",
+    "SMOVE", "SORT", "SPOP", "SRANDMEMBER", "SREM", "SSCAN", "SUBSCRIBE",
+    "SUBSTR", "SUNION", "SUNIONSTORE", "TIME", "TTL", "TYPE", "UNLINK",
+    "UNSUBSCRIBE", "UNWATCH", "WATCH", "ZADD", "ZCARD", "ZCOUNT", "ZINCRBY",
+    "ZINTERSTORE", "ZRANGE", "ZRANGEBYSCORE", "ZRANK", "ZREM",
+    "ZREMRANGEBYRANK", "ZREMRANGEBYSCORE", "ZREVRANGE", "ZREVRANGEBYSCORE",
+    "ZREVRANK", "ZSCAN", "ZSCORE", "ZUNIONSTORE",
+)
+
+# integers in this range are encoded from a cache
+SMALL_INT_MIN = -1
+SMALL_INT_MAX = 1024
+
+# arrays of up to this many elements get a cached header
+ARRAY_HEADER_MAX = 64
+
+# values of at least this many bytes are written without being copied
+SEGMENT_MIN = 16384
+
+# types supporting the buffer protocol which are sent as raw bytes. Twisted
+# only writes str, so they are converted (copied) once, by as_bytes().
+BUFFER_TYPES = (bytearray, buffer, memoryview, array.array)
+
+
+def _bulk(s):
+    return "$%s\r\n%s\r\n" % (len(s), s)
+
+
+_COMMAND_HEADERS = dict((name, _bulk(name)) for name in COMMANDS)
+_SMALL_INTS = dict(
+    (i, _bulk(str(i))) for i in xrange(SMALL_INT_MIN, SMALL_INT_MAX)
+)
+_ARRAY_HEADERS = ["*%s\r\n" % n for n in xrange(ARRAY_HEADER_MAX)]
+
+
+def as_bytes(s):
+    """
+    Return the contents of a buffer protocol object as a str.
+    """
+    if type(s) is memoryview:
+        return s.tobytes()
+    return str(buffer(s))
+
+
+def encode_arg(s, charset="utf-8", errors="strict"):
+    """
+    Encode a single command argument as a bulk string.
+    """
+    t = type(s)
+    if t is str:
+        return "$%s\r\n%s\r\n" % (len(s), s)
+    if t is int:
+        cached = _SMALL_INTS.get(s)
+        if cached is not None:
+            return cached
+        return _bulk(str(s))
+    if t is unicode or isinstance(s, unicode):
+        if charset is None:
+            raise InvalidData("Encoding charset was not specified")
+        try:
+            return _bulk(s.encode(charset, errors))
+        except UnicodeEncodeError as e:
+            raise InvalidData(
+                "Error encoding unicode value '%s': %s" % (repr(s), e))
+    if t is float or isinstance(s, float):
+        return _bulk(format(s, "f"))
+    if isinstance(s, str):
+        return _bulk(s)
+    if isinstance(s, BUFFER_TYPES):
+        return _bulk(as_bytes(s))
+    return _bulk(str(s))
+
+
+def encode_command(args, charset="utf-8", errors="strict"):
+    """
+    Encode a command, given as a sequence of its name and arguments, into a
+    list of segments.
+    """
+    n = len(args)
+    name = args[0]
+    header = _COMMAND_HEADERS.get(name) if type(name) is str else None
+    if header is None:
+        header = encode_arg(name, charset, errors)
+    if n < ARRAY_HEADER_MAX:
+        command = _ARRAY_HEADERS[n] + header
+    else:
+        command = "*%s\r\n%s" % (n, header)
+
+    # encode_arg() inlined for the common argument types. CPython extends
+    # the command in place, which beats building a list and joining it.
+    segments = None
+    for s in args[1:]:
+        t = type(s)
+        if t is str:
+            if len(s) < SEGMENT_MIN:
+                command += "$%s\r\n%s\r\n" % (len(s), s)
+                continue
+        elif t is int and SMALL_INT_MIN <= s < SMALL_INT_MAX:
+            command += _SMALL_INTS[s]
+            continue
+        elif t is unicode and charset is not None:
+            try:
+                s = s.encode(charset, errors)
+            except UnicodeEncodeError:
+                command += encode_arg(s, charset, errors)
+            else:
+                command += "$%s\r\n%s\r\n" % (len(s), s)
+            continue
+        elif isinstance(s, BUFFER_TYPES):
+            s = as_bytes(s)
+            if len(s) < SEGMENT_MIN:
+                command += "$%s\r\n%s\r\n" % (len(s), s)
+                continue
+        else:
+            command += encode_arg(s, charset, errors)
+            continue
+
+        # a large value: end the current segment with its header and write
+        # the value itself as the next one.
+        if segments is None:
+            segments = []
+        segments.append(command + "$%s\r\n" % len(s))
+        segments.append(s)
+        command = "\r\n"
+
+    if segments is None:
+        return [command]
+    segments.append(command)
+    return segments
@@ -30,3 +30,19 @@ class InvalidData(RedisError):
 
 class WatchError(RedisError):
     pass
+
+
+class TimeoutError(RedisError):
+    pass
+
+
+class ShardError(RedisError):
+    """
+    A command spread over several shards failed on some of them.
+    ``failures`` maps each of these shards to its Failure, and ``results``
+    holds what the command returned on the others.
+    """
+    def __init__(self, message, failures, results=None):
+        RedisError.__init__(self, message)
+        self.failures = failures
+        self.results = results
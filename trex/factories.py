@@ -1,28 +1,86 @@
-from .connections import ConnectionHandler
-from .exceptions import ConnectionError
+import collections
+import time
+
+from .connections import ConnectionHandler, switch_to_errback
+from .exceptions import ConnectionError, TimeoutError
 from .protocols import RedisProtocol, SubscriberProtocol, MonitorProtocol
+from .strategies import get_strategy
+from .timers import TimerHeap
 
 from twisted.python import log
+from twisted.python.failure import Failure
+from twisted.internet import reactor, task
 from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.internet.defer import (
-    Deferred, DeferredQueue, CancelledError, inlineCallbacks, returnValue,
-    succeed
+    Deferred, DeferredQueue, CancelledError, fail, inlineCallbacks,
+    returnValue, succeed
 )
 
 
+# What to do with commands issued while no connection is up: wait for one
+# without bound (None), fail them straight away, buffer them, or buffer only
+# those which can safely be sent twice.
+OFFLINE_POLICIES = (None, "fail", "buffer", "idempotent")
+
+
 class RedisFactory(ReconnectingClientFactory):
     maxDelay = 10
     protocol = RedisProtocol
 
+    # elastic pools open another connection once this many callers are
+    # waiting for one, or once a caller has waited for growAfter seconds.
+    growWaiters = 2
+    growAfter = 0.1
+    # and close connections that have been idle for idleTimeout seconds.
+    idleTimeout = 300
+    # with heartbeats, connections which do not answer a PING within
+    # heartbeatTimeout seconds are dropped and reconnected.
+    heartbeatTimeout = 5
+    # with an offline policy, commands issued while no connection is up are
+    # buffered, up to offlineMaxCommands commands and offlineMaxBytes bytes
+    # of arguments, until a connection comes back.
+    offlineMaxCommands = 1000
+    offlineMaxBytes = 1024 * 1024
+
     def __init__(
         self, uuid, dbid, poolsize, isLazy=False, handler=ConnectionHandler,
-        charset="utf-8", password=None
+        charset="utf-8", password=None, autopipeline=False, multiplex=False,
+        strategy=None, minsize=None, maxsize=None, idleTimeout=None,
+        commandTimeout=None, decodeResponses=True, blockingPoolsize=None,
+        heartbeatInterval=None, heartbeatTimeout=None, offlinePolicy=None,
+        offlineMaxCommands=None, offlineMaxBytes=None
     ):
         if not isinstance(poolsize, int):
             raise ValueError(
                 "Redis poolsize must be an integer, not %s" % repr(poolsize)
             )
 
+        if minsize is None:
+            minsize = poolsize if maxsize is None else min(poolsize, maxsize)
+        maxsize = max(poolsize, minsize) if maxsize is None else maxsize
+        if not isinstance(minsize, int) or not isinstance(maxsize, int) or \
+                not 0 < minsize <= maxsize:
+            raise ValueError(
+                "Redis pool minsize and maxsize must be integers with "
+                "0 < minsize <= maxsize, not %s and %s" %
+                (repr(minsize), repr(maxsize))
+            )
+
+        if blockingPoolsize is not None and (
+                not isinstance(blockingPoolsize, int) or blockingPoolsize < 1):
+            raise ValueError(
+                "Redis blockingPoolsize must be a positive integer, not %s" %
+                repr(blockingPoolsize)
+            )
+
+        if offlinePolicy not in OFFLINE_POLICIES:
+            raise ValueError(
+                "Redis offlinePolicy must be one of %s, not %s" % (
+                    ", ".join(repr(p) for p in OFFLINE_POLICIES),
+                    repr(offlinePolicy)
+                )
+            )
+
         if not isinstance(dbid, (int, type(None))):
             raise ValueError(
                 "Redis dbid must be an integer, not %s" % repr(dbid)
@@ -30,10 +88,43 @@ class RedisFactory(ReconnectingClientFactory):
 
         self.uuid = uuid
         self.dbid = dbid
-        self.poolsize = poolsize
+        # the number of connections opened up front
+        self.poolsize = min(max(poolsize, minsize), maxsize)
+        self.minsize = minsize
+        self.maxsize = maxsize
+        if idleTimeout is not None:
+            self.idleTimeout = idleTimeout
+        self.heartbeatInterval = heartbeatInterval
+        if heartbeatTimeout is not None:
+            self.heartbeatTimeout = heartbeatTimeout
+        self.offlinePolicy = offlinePolicy
+        if offlineMaxCommands is not None:
+            self.offlineMaxCommands = offlineMaxCommands
+        if offlineMaxBytes is not None:
+            self.offlineMaxBytes = offlineMaxBytes
         self.isLazy = isLazy
         self.charset = charset
         self.password = password
+        self.autopipeline = autopipeline
+        self.multiplex = multiplex
+        self.strategy = get_strategy(strategy)
+        self.commandTimeout = commandTimeout
+        self.decodeResponses = decodeResponses
+        self.blockingPoolsize = blockingPoolsize
+        # the pool of up to blockingPoolsize connections for blocking
+        # commands, opened by getBlockingFactory() on first use.
+        self.blockingFactory = None
+        self.timers = TimerHeap()
+        # optimistic transactions retried after a watched key changed, and
+        # given up on once they ran out of retries.
+        self.transactionRetries = 0
+        self.transactionsFailed = 0
+        # connections dropped after missing a heartbeat
+        self.heartbeatsMissed = 0
+        # commands waiting for a connection to come back, and the size of
+        # their arguments.
+        self.offlineBuffer = collections.deque()
+        self.offlineBytes = 0
 
         self.idx = 0
         self.size = 0
@@ -43,18 +134,269 @@ class RedisFactory(ReconnectingClientFactory):
         self.connectionQueue = DeferredQueue()
         self._waitingForEmptyPool = set()
 
+        self.endpoint = None
+        self.address = ()
+        self.connectors = set()
+        self._retired = set()
+        # set once disconnect() has been called, for good
+        self.disconnected = False
+        self._growCall = None
+        self._reaper = None
+        self._heartbeat = None
+
+    def setEndpoint(self, endpoint, *address):
+        """
+        Record how to reach redis, e.g. (reactor.connectTCP, host, port), so
+        that the factory can open connections of its own.
+        """
+        self.endpoint = endpoint
+        self.address = address
+
+    def openConnection(self):
+        connector = self.endpoint(*(self.address + (self,)))
+        self.connectors.add(connector)
+        return connector
+
+    def disconnect(self):
+        """
+        Close the pool for good: close its connections, and stop the
+        connectors which are still connecting so that they do not join it
+        afterwards. Callers waiting for a connection fail with
+        ConnectionError.
+        """
+        self.disconnected = True
+        self.stopTrying()
+        if self._growCall is not None:
+            self._growCall.cancel()
+            self._growCall = None
+        for conn in self.pool:
+            try:
+                conn.transport.loseConnection()
+            except:
+                pass
+        for connector in list(self.connectors):
+            connector.disconnect()
+        queue = self.connectionQueue
+        waiting, queue.waiting = queue.waiting, []
+        for d in waiting:
+            d.errback(ConnectionError("Disconnected"))
+
+    @property
+    def waiters(self):
+        """
+        The number of callers waiting for a connection to be checked in.
+        """
+        return len(self.connectionQueue.waiting)
+
+    @property
+    def elastic(self):
+        return self.endpoint is not None and self.minsize < self.maxsize
+
+    def _maybeGrow(self):
+        """
+        Called when a caller is about to wait for a connection: open a new
+        one straight away if enough callers are waiting already, and check
+        again once growAfter seconds have passed.
+        """
+        if not self.elastic:
+            return
+        # the caller itself is not waiting yet
+        if self.waiters + 1 >= self.growWaiters:
+            self._grow()
+        if self._growCall is None:
+            self._growCall = reactor.callLater(
+                self.growAfter, self._checkGrowth
+            )
+
+    def _checkGrowth(self):
+        self._growCall = None
+        if not self.waiters:
+            return
+        # connectors which are not connected yet will serve a waiter soon
+        if self.waiters > len(self.connectors) - self.size:
+            self._grow()
+        self._growCall = reactor.callLater(self.growAfter, self._checkGrowth)
+
+    def _grow(self):
+        if len(self.connectors) < self.maxsize:
+            log.msg("Growing redis pool %s to %d connection(s)" % (
+                self.uuid, len(self.connectors) + 1
+            ))
+            self.openConnection()
+
+    def _reap(self):
+        """
+        Close connections which have been idle for longer than idleTimeout,
+        down to minsize connections.
+        """
+        deadline = time.time() - self.idleTimeout
+        for conn in list(self.connectionQueue.pending):
+            if len(self.connectors) <= self.minsize:
+                break
+            if conn.outstanding or conn.lastActivity > deadline:
+                continue
+            self.connectionQueue.pending.remove(conn)
+            self.retireConnection(conn)
+
+    def _sendHeartbeats(self):
+        """
+        PING the pooled connections which have been idle for longer than
+        heartbeatInterval. They are kept out of the pool until they reply,
+        so that no command is sent on a connection which may be half-open.
+        """
+        idle = time.time() - self.heartbeatInterval
+        for conn in list(self.connectionQueue.pending):
+            if not conn.connected or conn.outstanding or \
+                    conn.lastActivity > idle:
+                continue
+            self.connectionQueue.pending.remove(conn)
+            timer = self.timers.add(
+                self.timers.seconds() + self.heartbeatTimeout,
+                self._heartbeatMissed, conn
+            )
+            conn.ping().addBoth(self._heartbeatReceived, conn, timer)
+
+    def _heartbeatReceived(self, reply, conn, timer):
+        self.timers.cancel(timer)
+        if not conn.connected:
+            # dropped, either by _heartbeatMissed or by the connection
+            # itself
+            return
+        if isinstance(reply, Failure):
+            self._heartbeatMissed(conn)
+        else:
+            self.connectionQueue.put(conn)
+
+    def _heartbeatMissed(self, conn):
+        """
+        Drop a connection which did not answer its heartbeat; unless the
+        factory stopped trying, it is replaced by reconnecting.
+        """
+        self.heartbeatsMissed += 1
+        log.msg("Redis connection to %s missed its heartbeat, dropping it" %
+                self.uuid)
+        conn.connected = 0
+        conn.transport.abortConnection()
+
+    def retireConnection(self, conn):
+        """
+        Close a pooled connection for good, without reconnecting it.
+        """
+        connector = getattr(conn.transport, 'connector', None)
+        if connector is not None:
+            self.connectors.discard(connector)
+            self._retired.add(connector)
+        conn.transport.loseConnection()
+
+    def clientConnectionLost(self, connector, reason):
+        if connector in self._retired:
+            self._retired.discard(connector)
+            return
+        if not self.continueTrying:
+            self.connectors.discard(connector)
+        ReconnectingClientFactory.clientConnectionLost(
+            self, connector, reason
+        )
+
+    def clientConnectionFailed(self, connector, reason):
+        if not self.continueTrying:
+            self.connectors.discard(connector)
+        ReconnectingClientFactory.clientConnectionFailed(
+            self, connector, reason
+        )
+
     def buildProtocol(self, addr):
         if hasattr(self, 'charset'):
             p = self.protocol(self.charset)
         else:
             p = self.protocol()
         p.factory = self
+        p.autopipeline = self.autopipeline
+        p.decodeResponses = self.decodeResponses
         return p
 
+    @property
+    def offlineDepth(self):
+        """
+        The number of commands buffered until a connection comes back.
+        """
+        return len(self.offlineBuffer)
+
+    def bufferCommand(self, send, size, deadline=None):
+        """
+        Buffer a command while no connection is up. send(connection) is
+        called to send it once one comes back, and the Deferred returned
+        fires with its reply. It fails with ConnectionError straight away
+        if the offline buffer is full, and with TimeoutError if deadline
+        passes before the command could be sent.
+        """
+        if len(self.offlineBuffer) >= self.offlineMaxCommands or \
+                self.offlineBytes + size > self.offlineMaxBytes:
+            return fail(ConnectionError(
+                "Not connected, and the offline buffer is full"
+            ))
+        entry = [send, size, Deferred(), None]
+        if deadline is not None:
+            entry[3] = self.timers.add(deadline, self._offlineTimedOut, entry)
+        self.offlineBuffer.append(entry)
+        self.offlineBytes += size
+        return entry[2]
+
+    def _offlineTimedOut(self, entry):
+        self.offlineBuffer.remove(entry)
+        self.offlineBytes -= entry[1]
+        entry[2].errback(TimeoutError(
+            "Timed out waiting for a connection to send a command"
+        ))
+
+    def failOffline(self, reason):
+        """
+        Fail every buffered command with reason.
+        """
+        buffered, self.offlineBuffer = self.offlineBuffer, collections.deque()
+        self.offlineBytes = 0
+        for send, size, d, timer in buffered:
+            if timer is not None:
+                self.timers.cancel(timer)
+            d.errback(reason)
+
+    def _flushOffline(self, conn):
+        """
+        Send all of the buffered commands on conn as a single pipeline; conn
+        goes back to the pool once their replies are in.
+        """
+        buffered, self.offlineBuffer = self.offlineBuffer, collections.deque()
+        self.offlineBytes = 0
+        conn.pipeline()
+        for send, size, d, timer in buffered:
+            if timer is not None:
+                self.timers.cancel(timer)
+            try:
+                reply = send(conn)
+            except Exception:
+                d.errback()
+                continue
+            reply.addCallback(switch_to_errback)
+            reply.addCallbacks(d.callback, d.errback)
+        conn.execute_pipeline(raise_on_error=False)
+
     def addConnection(self, conn):
-        self.connectionQueue.put(conn)
+        if self.disconnected:
+            # its connector was past stopping when the pool was closed
+            conn.transport.loseConnection()
+            return
+        if self.offlineBuffer:
+            self._flushOffline(conn)
+        else:
+            self.connectionQueue.put(conn)
         self.pool.append(conn)
         self.size = len(self.pool)
+        if self.elastic and self._reaper is None:
+            self._reaper = task.LoopingCall(self._reap)
+            self._reaper.start(self.idleTimeout / 2.0, now=False)
+        if self.heartbeatInterval and self._heartbeat is None:
+            self._heartbeat = task.LoopingCall(self._sendHeartbeats)
+            self._heartbeat.start(self.heartbeatInterval / 2.0, now=False)
         if self.deferred:
             if self.size == self.poolsize:
                 self.deferred.callback(self.handler)
@@ -64,9 +406,22 @@ class RedisFactory(ReconnectingClientFactory):
         try:
             self.pool.remove(conn)
         except Exception as e:
-            log.msg("Could not remove connection from pool: %s" % str(e))
+            if not self.disconnected:
+                log.msg(
+                    "Could not remove connection from pool: %s" % str(e)
+                )
 
         self.size = len(self.pool)
+        if not self.size:
+            if self._reaper is not None:
+                self._reaper.stop()
+                self._reaper = None
+            if self._heartbeat is not None:
+                self._heartbeat.stop()
+                self._heartbeat = None
+            if self._growCall is not None:
+                self._growCall.cancel()
+                self._growCall = None
         if not self.size and self._waitingForEmptyPool:
             deferreds = self._waitingForEmptyPool
             self._waitingForEmptyPool = set()
@@ -94,11 +449,20 @@ class RedisFactory(ReconnectingClientFactory):
 
     @inlineCallbacks
     def getConnection(self, put_back=False):
+        if self.disconnected:
+            raise ConnectionError("Disconnected")
         if not self.size and not self.isLazy:
             raise ConnectionError("Not connected")
 
         while True:
-            conn = yield self.connectionQueue.get()
+            pending = self.connectionQueue.pending
+            if len(pending) > 1:
+                conn = self.strategy.select(pending)
+                pending.remove(conn)
+            else:
+                if not pending:
+                    self._maybeGrow()
+                conn = yield self.connectionQueue.get()
             if conn.connected == 0:
                 log.msg('Discarding dead connection.')
             else:
@@ -106,6 +470,50 @@ class RedisFactory(ReconnectingClientFactory):
                     self.connectionQueue.put(conn)
                 returnValue(conn)
 
+    def getBlockingFactory(self):
+        """
+        Return the factory of the pool which blocking commands are sent on,
+        so that they never tie up connections of this one. It starts with a
+        single connection and opens another one, up to blockingPoolsize, as
+        soon as a caller has to wait. Its size, waiters and outstanding are
+        the metrics of the blocking pool.
+        """
+        if self.blockingFactory is None:
+            factory = RedisFactory(
+                self.uuid, self.dbid, 1, isLazy=True,
+                handler=self.handler.__class__, charset=self.charset,
+                password=self.password, minsize=1,
+                maxsize=self.blockingPoolsize, idleTimeout=self.idleTimeout,
+                decodeResponses=self.decodeResponses,
+                heartbeatInterval=self.heartbeatInterval,
+                heartbeatTimeout=self.heartbeatTimeout
+            )
+            factory.growWaiters = 1
+            factory.continueTrying = self.continueTrying
+            factory.setEndpoint(self.endpoint, *self.address)
+            factory.openConnection()
+            self.blockingFactory = factory
+        return self.blockingFactory
+
+    def getSharedConnection(self):
+        """
+        Returns a Deferred which fires with a connection chosen by the
+        selection strategy among those that have not been checked out,
+        leaving it in the pool so that it can carry several outstanding
+        commands at once.
+        """
+        available = [c for c in self.connectionQueue.pending if c.connected]
+        if available:
+            return succeed(self.strategy.select(available))
+        return self.getConnection(put_back=True)
+
+    @property
+    def outstanding(self):
+        """
+        The number of commands awaiting replies across the whole pool.
+        """
+        return sum(conn.outstanding for conn in self.pool)
+
 
 class SubscriberFactory(RedisFactory):
     protocol = SubscriberProtocol
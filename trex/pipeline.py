@@ -0,0 +1,279 @@
+"""
+Explicit pipelines.
+
+Rather than a Deferred per command gathered in a DeferredList, a pipeline
+keeps a list of its results which the protocol fills as replies arrive, and
+a single Deferred fired with it once the last reply is in.
+"""
+from twisted.internet.defer import Deferred, FirstError
+from twisted.python.failure import Failure
+
+
+class PipelineResults(list):
+    """
+    The replies to the commands of a pipeline, in order. Commands which
+    failed have their exception in place of a reply; ``failures`` counts
+    them.
+    """
+    failures = 0
+
+    def failed(self):
+        """
+        Return the indexes of the commands which failed.
+        """
+        if not self.failures:
+            return []
+        return [
+            i for i, reply in enumerate(self) if isinstance(reply, Exception)
+        ]
+
+
+class Pipeline(object):
+    """
+    The results of an explicit pipeline, filled in place as replies arrive.
+    ``deferred`` fires with the PipelineResults once the last reply is in.
+    Unless ``raiseOnError`` is false it fails with FirstError on the first
+    error instead, as a DeferredList with fireOnOneErrback would.
+    """
+    transaction = False
+
+    def __init__(self):
+        self.results = PipelineResults()
+        self.remaining = 0
+        self.raiseOnError = True
+        self.failure = None
+        self.deferred = None
+
+    def add(self):
+        """
+        Reserve a place for the reply to the next pipelined command.
+        """
+        index = len(self.results)
+        self.results.append(None)
+        self.remaining += 1
+        return PipelinedReply(self, index)
+
+    def execute(self, raiseOnError=True):
+        """
+        Return the Deferred for the results, once all commands are sent.
+        """
+        self.raiseOnError = raiseOnError
+        self.deferred = d = Deferred()
+        if self.failure is not None:
+            d.errback(self.failure)
+        elif not self.remaining:
+            d.callback(self.results)
+        return d
+
+    def replied(self, index, reply):
+        self.results[index] = reply
+        self.remaining -= 1
+        d = self.deferred
+        if not self.remaining and d is not None and not d.called:
+            d.callback(self.results)
+
+    def failed(self, index, failure):
+        if not self.raiseOnError:
+            self.results.failures += 1
+            self.replied(index, failure.value)
+            return
+        self.remaining -= 1
+        if self.failure is not None:
+            return
+        self.failure = Failure(FirstError(failure, index))
+        d = self.deferred
+        if d is not None and not d.called:
+            d.errback(self.failure)
+
+
+class PipelinedReply(object):
+    """
+    The reply to a pipelined command, which is stored directly into the
+    Pipeline results by the protocol's ReplyQueue.
+
+    Callers which add callbacks get them run as with the Deferred returned
+    by a regular command, the outcome of their callbacks being what ends up
+    in the results; only then is a Deferred created.
+    """
+    __slots__ = ("pipeline", "index", "called", "_deferred")
+
+    def __init__(self, pipeline, index):
+        self.pipeline = pipeline
+        self.index = index
+        self.called = False
+        self._deferred = None
+
+    def callback(self, reply):
+        self.called = True
+        if self._deferred is None:
+            self.pipeline.replied(self.index, reply)
+        else:
+            self._deferred.addBoth(self._done)
+            self._deferred.callback(reply)
+
+    def errback(self, reason):
+        self.called = True
+        if self._deferred is None:
+            self.pipeline.failed(self.index, Failure(reason))
+        else:
+            self._deferred.addBoth(self._done)
+            self._deferred.errback(reason)
+
+    def _done(self, result):
+        if isinstance(result, Failure):
+            self.pipeline.failed(self.index, result)
+            return None
+        self.pipeline.replied(self.index, result)
+        return result
+
+    def asDeferred(self):
+        """
+        Return a Deferred for this reply, e.g. to put it in a DeferredList.
+        """
+        if self._deferred is None:
+            self._deferred = Deferred()
+        return self._deferred
+
+    def addCallbacks(self, callback, errback=None, callbackArgs=(),
+                     callbackKeywords={}, errbackArgs=(),
+                     errbackKeywords={}):
+        self.asDeferred().addCallbacks(
+            callback, errback, callbackArgs, callbackKeywords, errbackArgs,
+            errbackKeywords
+        )
+        return self
+
+    def addCallback(self, callback, *args, **kw):
+        self.asDeferred().addCallback(callback, *args, **kw)
+        return self
+
+    def addErrback(self, errback, *args, **kw):
+        self.asDeferred().addErrback(errback, *args, **kw)
+        return self
+
+    def addBoth(self, callback, *args, **kw):
+        self.asDeferred().addBoth(callback, *args, **kw)
+        return self
+
+
+class PipelineStream(object):
+    """
+    Send an unbounded stream of commands on a connection, like
+    ``redis-cli --pipe``.
+
+    Commands are taken from the ``commands`` iterable as argument tuples
+    for execute_command(), and written out every ``maxCommands`` commands
+    or ``maxBytes`` bytes. No more than ``maxUnacked`` commands await their
+    reply at any time: the stream resumes once enough replies are in for
+    another full batch.
+
+    callback(index, reply) is called with each reply as it arrives, failed
+    commands having their exception as reply. ``deferred`` fires with the
+    stream once every reply is in; if the commands iterable or the callback
+    raised, it fails with that error instead.
+    """
+    def __init__(self, connection, commands, callback=None,
+                 maxCommands=1000, maxBytes=65536, maxUnacked=10000):
+        self.connection = connection
+        self.commands = iter(commands)
+        self.callback = callback
+        self.maxCommands = maxCommands
+        self.maxBytes = maxBytes
+        self.maxUnacked = maxUnacked
+        self.lowWater = max(maxUnacked - maxCommands, 0)
+        self.decodeResponses = connection.decodeResponses
+
+        self.sent = 0
+        self.unacked = 0
+        self.failures = 0
+        self.failure = None
+        self.exhausted = False
+        self._sending = False
+        self.deferred = Deferred()
+
+    def start(self):
+        conn = self.connection
+        conn.flush_autopipeline()
+        conn.pipelining = True
+        conn.pipelined_commands = []
+        conn.pipelined_replies = self
+        self._send()
+        return self.deferred
+
+    def add(self):
+        index = self.sent
+        self.sent += 1
+        self.unacked += 1
+        return PipelinedReply(self, index)
+
+    def _send(self):
+        conn = self.connection
+        decode, conn.decodeResponses = conn.decodeResponses, \
+            self.decodeResponses
+        self._sending = True
+        count = size = 0
+        try:
+            while self.unacked < self.maxUnacked:
+                try:
+                    args = next(self.commands)
+                except StopIteration:
+                    self.exhausted = True
+                    break
+                buffered = conn.pipelined_commands
+                start = len(buffered)
+                conn.execute_command(*args)
+                for i in xrange(start, len(buffered)):
+                    size += len(buffered[i])
+                count += 1
+                if count >= self.maxCommands or size >= self.maxBytes:
+                    self._flush()
+                    count = size = 0
+        except Exception:
+            self._stop(Failure())
+        finally:
+            conn.decodeResponses = decode
+            self._sending = False
+        self._flush()
+        self._check()
+
+    def _flush(self):
+        conn = self.connection
+        if conn.pipelined_commands and conn.connected:
+            conn.transport.writeSequence(conn.pipelined_commands)
+        conn.pipelined_commands = []
+
+    def _stop(self, failure):
+        self.exhausted = True
+        if self.failure is None:
+            self.failure = failure
+
+    def _check(self):
+        if self.unacked or self._sending or not self.exhausted or \
+                self.deferred.called:
+            return
+        conn = self.connection
+        conn.pipelining = False
+        conn.pipelined_commands = []
+        conn.pipelined_replies = None
+        if self.failure is not None:
+            self.deferred.errback(self.failure)
+        else:
+            self.deferred.callback(self)
+
+    def replied(self, index, reply):
+        self.unacked -= 1
+        if self.callback is not None:
+            try:
+                self.callback(index, reply)
+            except Exception:
+                self._stop(Failure())
+        if self._sending:
+            return
+        if not self.exhausted and self.unacked <= self.lowWater:
+            self._send()
+        else:
+            self._check()
+
+    def failed(self, index, failure):
+        self.failures += 1
+        self.replied(index, failure.value)
@@ -1,17 +1,81 @@
+import collections
 import hiredis
-import string
+import time
 
 from .exceptions import InvalidData, ResponseError, ConnectionError
 from .api import RedisApiMixin
+from .decoding import AUTO, EXEC, FALLBACK, RAW, restore, undecodable
 
 from twisted.protocols.basic import LineReceiver
 from twisted.protocols import policies
 from twisted.python import log
-from twisted.internet.defer import inlineCallbacks, DeferredQueue, returnValue
+from twisted.internet.defer import (
+    Deferred, fail, inlineCallbacks, returnValue, succeed
+)
 
 
-# Possible first characters in a string containing an integer or a float.
-_NUM_FIRST_CHARS = frozenset(string.digits + "+-.")
+class ReplyQueue(object):
+    """
+    The Deferreds of the commands sent on a connection, in the order their
+    replies will arrive.
+
+    Unlike a DeferredQueue, replies which are exceptions errback their
+    Deferred directly, and a Deferred cancelled by its caller keeps its
+    place so that the following replies still reach their own callers.
+    Replies arriving while nothing waits (e.g. for SUBSCRIBE to several
+    channels) are kept for the next get().
+    """
+    def __init__(self):
+        self.waiting = collections.deque()
+        self.pending = collections.deque()
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def get(self):
+        if self.pending:
+            reply = self.pending.popleft()
+            if isinstance(reply, Exception):
+                return fail(reply)
+            return succeed(reply)
+        d = Deferred()
+        self.waiting.append(d)
+        return d
+
+    def put(self, reply):
+        if not self.waiting:
+            self.pending.append(reply)
+            return
+        d = self.waiting.popleft()
+        if d.called:
+            return
+        if isinstance(reply, Exception):
+            d.errback(reply)
+        else:
+            d.callback(reply)
+
+    def expect(self, waiter):
+        """
+        Queue waiter, anything with the callback()/errback() interface of a
+        Deferred, for the next reply.
+        """
+        if self.pending:
+            reply = self.pending.popleft()
+            if isinstance(reply, Exception):
+                waiter.errback(reply)
+            else:
+                waiter.callback(reply)
+        else:
+            self.waiting.append(waiter)
+
+    def failAll(self, reason):
+        """
+        Errback every waiting Deferred with reason.
+        """
+        waiting, self.waiting = self.waiting, collections.deque()
+        for d in waiting:
+            if not d.called:
+                d.errback(reason)
 
 
 class RedisProtocol(LineReceiver, policies.TimeoutMixin, RedisApiMixin):
@@ -20,11 +84,19 @@ class RedisProtocol(LineReceiver, policies.TimeoutMixin, RedisApiMixin):
     """
     delimiter = '\r\n'
     MAX_LENGTH = 16384
+    AUTOPIPELINE_MAX_BYTES = 65536
+    LATENCY_EWMA_ALPHA = 0.2
+    trackLatency = True
+    typedReplies = True
 
     def __init__(self, charset="utf-8", errors="strict"):
         self._reader = hiredis.Reader(
             protocolError=InvalidData, replyError=ResponseError
         )
+        # whether the reader currently decodes strings with the charset, and
+        # the strings of the reply being read which it could not decode
+        self._readerDecodes = False
+        self._undecodable = []
         self.charset = charset
         self.errors = errors
 
@@ -33,7 +105,24 @@ class RedisProtocol(LineReceiver, policies.TimeoutMixin, RedisApiMixin):
 
         self.post_proc = []
 
-        self.replyQueue = DeferredQueue()
+        self.replyQueue = ReplyQueue()
+        self._waitingForDrain = []
+
+        # the decoders of the replies still to come, and those of the
+        # commands queued in the current MULTI, to be applied to EXEC.
+        self._decoders = collections.deque()
+        self._queuedDecoders = []
+        # when False, replies are handed over as hiredis parsed them
+        self.decodeResponses = True
+
+        # send times of the outstanding commands and the exponentially
+        # weighted moving average of the reply latency, in seconds.
+        self._sentTimes = collections.deque()
+        self.latency = 0.0
+        self.lastActivity = time.time()
+
+        # the deadline, in reactor seconds, for the command being issued
+        self.deadline = None
 
         self.transactions = 0
         self.inTransaction = False
@@ -44,7 +133,30 @@ class RedisProtocol(LineReceiver, policies.TimeoutMixin, RedisApiMixin):
 
         self.pipelining = False
         self.pipelined_commands = []
-        self.pipelined_replies = []
+        self.pipelined_replies = None
+
+        self.autopipeline = False
+        self.autopipelined_commands = []
+        self.autopipelined_bytes = 0
+        self._autopipeline_call = None
+
+    @property
+    def outstanding(self):
+        """
+        The number of commands sent on this connection still awaiting replies.
+        """
+        return len(self.replyQueue.waiting)
+
+    def whenDrained(self):
+        """
+        Returns a Deferred which fires once every outstanding reply on this
+        connection has been received.
+        """
+        if not self.replyQueue.waiting:
+            return succeed(self)
+        d = Deferred()
+        self._waitingForDrain.append(d)
+        return d
 
     @inlineCallbacks
     def connectionMade(self):
@@ -86,47 +198,88 @@ class RedisProtocol(LineReceiver, policies.TimeoutMixin, RedisApiMixin):
     def connectionLost(self, why):
         self.connected = 0
         self.script_hashes.clear()
+        if self._autopipeline_call is not None:
+            if self._autopipeline_call.active():
+                self._autopipeline_call.cancel()
+            self._autopipeline_call = None
+        self.autopipelined_commands = []
+        self.autopipelined_bytes = 0
         self.factory.delConnection(self)
         LineReceiver.connectionLost(self, why)
-        while self.replyQueue.waiting:
-            self.replyReceived(ConnectionError("Lost connection"))
+        self._sentTimes.clear()
+        self._decoders.clear()
+        self._queuedDecoders = []
+        del self._undecodable[:]
+        self.replyQueue.failAll(ConnectionError("Lost connection"))
+        self._drained()
 
     def dataReceived(self, data, unpause=False):
         self.resetTimeout()
         if data:
             self._reader.feed(data)
-        res = self._reader.gets()
-        while res is not False:
-            if isinstance(res, basestring):
-                res = self.tryConvertData(res)
-            elif isinstance(res, list):
-                res = map(self.tryConvertData, res)
-            if res == "QUEUED":
+        while True:
+            # the decoder of the next reply tells whether the reader should
+            # decode its strings.
+            if self._decoders:
+                decoder = self._decoders[0]
+            else:
+                decoder = AUTO if self.decodeResponses else RAW
+            decodes = decoder.text and self.charset is not None
+            if decodes is not self._readerDecodes:
+                self._setReaderDecodes(decodes)
+
+            try:
+                res = self._reader.gets()
+            finally:
+                if undecodable:
+                    # they belong to the reply this reader is parsing, which
+                    # may only be complete after more data is received
+                    self._undecodable.extend(undecodable)
+                    del undecodable[:]
+            if res is False:
+                break
+            if self._decoders:
+                self._decoders.popleft()
+            if self._undecodable:
+                res = restore(res, self._undecodable)
+
+            if decoder is RAW and not self.inTransaction:
+                self.replyReceived(res)
+            elif res == "QUEUED" and self.inTransaction:
+                self._queuedDecoders.append(decoder)
+                res = AUTO(res, self.charset)
                 self.transactions += 1
+                self.replyReceived(res)
             else:
+                res = self.decodeReply(res, decoder, decodes)
                 res = self.handleTransactionData(res)
-
-            self.replyReceived(res)
-            res = self._reader.gets()
+                self.replyReceived(res)
+
+    def _setReaderDecodes(self, decodes):
+        if decodes:
+            # strings which cannot be decoded are left as bytes, unless a
+            # lenient error handler was asked for.
+            errors = FALLBACK if self.errors == "strict" else self.errors
+            self._reader.set_encoding(self.charset, errors)
+        else:
+            self._reader.set_encoding(None)
+        self._readerDecodes = decodes
+
+    def decodeReply(self, reply, decoder, decoded=False):
+        if decoder is EXEC:
+            decoders, self._queuedDecoders = self._queuedDecoders, []
+            if type(reply) is list:
+                return [self.decodeReply(r, d)
+                        for r, d in zip(reply, decoders)]
+        try:
+            if decoded:
+                return decoder.decoded(reply, self.charset)
+            return decoder(reply, self.charset)
+        except (TypeError, ValueError) as e:
+            return InvalidData("Could not decode reply %r: %s" % (reply, e))
 
     def tryConvertData(self, data):
-        if not isinstance(data, str):
-            return data
-        el = None
-        if data and data[0] in _NUM_FIRST_CHARS:  # Most likely a number
-            try:
-                el = int(data) if data.find('.') == -1 else float(data)
-            except ValueError:
-                pass
-
-        if el is None:
-            el = data
-            if self.charset is not None:
-                try:
-                    el = data.decode(self.charset)
-                except UnicodeDecodeError:
-                    pass
-        return el
+        return AUTO.convert(data, self.charset)
 
     def handleTransactionData(self, reply):
         # watch or multi has been called
@@ -157,7 +310,22 @@ class RedisProtocol(LineReceiver, policies.TimeoutMixin, RedisApiMixin):
         Complete reply received and ready to be pushed to the requesting
         function.
         """
+        if self._sentTimes:
+            sample = time.time() - self._sentTimes.popleft()
+            if self.latency:
+                self.latency += self.LATENCY_EWMA_ALPHA * (
+                    sample - self.latency
+                )
+            else:
+                self.latency = sample
         self.replyQueue.put(reply)
+        if self._waitingForDrain and not self.replyQueue.waiting:
+            self._drained()
+
+    def _drained(self):
+        deferreds, self._waitingForDrain = self._waitingForDrain, []
+        for d in deferreds:
+            d.callback(self)
 
     @staticmethod
     def handle_reply(r):
@@ -173,6 +341,8 @@ class MonitorProtocol(RedisProtocol):
 
     take care with the performance impact: http://redis.io/commands/monitor
     """
+    trackLatency = False
+    typedReplies = False
 
     def messageReceived(self, message):
         pass
@@ -188,6 +358,9 @@ class MonitorProtocol(RedisProtocol):
 
 
 class SubscriberProtocol(RedisProtocol):
+    trackLatency = False
+    typedReplies = False
+
     def messageReceived(self, pattern, channel, message):
         pass
 
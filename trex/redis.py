@@ -46,7 +46,22 @@ def connect(
     handler=None,
     hosts=None,
     path=None,
-    paths=None
+    paths=None,
+    autopipeline=False,
+    multiplex=False,
+    strategy=None,
+    minsize=None,
+    maxsize=None,
+    idleTimeout=None,
+    commandTimeout=None,
+    decodeResponses=True,
+    blockingPoolsize=None,
+    heartbeatInterval=None,
+    heartbeatTimeout=None,
+    offlinePolicy=None,
+    offlineMaxCommands=None,
+    offlineMaxBytes=None,
+    placement=None
 ):
 
     handler = handler or 'default'
@@ -65,16 +80,35 @@ def connect(
 
     path = path or '/tmp/redis.sock'
 
+    options = dict(
+        autopipeline=autopipeline,
+        multiplex=multiplex,
+        strategy=strategy,
+        minsize=minsize,
+        maxsize=maxsize,
+        idleTimeout=idleTimeout,
+        commandTimeout=commandTimeout,
+        decodeResponses=decodeResponses,
+        blockingPoolsize=blockingPoolsize,
+        heartbeatInterval=heartbeatInterval,
+        heartbeatTimeout=heartbeatTimeout,
+        offlinePolicy=offlinePolicy,
+        offlineMaxCommands=offlineMaxCommands,
+        offlineMaxBytes=offlineMaxBytes
+    )
+
     if not handler.startswith('sharded'):
         # non-sharded resource handling
         uri = '%s:%d' % (host, port) if not _IS_UNIX else path
         factory = RedisFactory(
-            uri, dbid, poolsize, isLazy, _handler, charset, password
+            uri, dbid, poolsize, isLazy, _handler, charset, password,
+            **options
         )
         factory.continueTrying = reconnect
-        args = (path, factory) if _IS_UNIX else (host, port, factory)
-        for x in xrange(poolsize):
-            endpoint(*args)
+        address = (path,) if _IS_UNIX else (host, port)
+        factory.setEndpoint(endpoint, *address)
+        for x in xrange(factory.poolsize):
+            factory.openConnection()
 
         if isLazy:
             return factory.handler
@@ -83,18 +117,29 @@ def connect(
 
     else:
         uris = hosts if not _IS_UNIX else paths
+        # shards may be weighted, given as (uri, weight) pairs or as a dict
+        if isinstance(uris, dict):
+            uris = uris.items()
+        weights = []
         connections = []
         for uri in uris:
+            if isinstance(uri, (tuple, list)):
+                uri, weight = uri
+            else:
+                weight = 1
+            weights.append(weight)
             if not _IS_UNIX:
                 host, port = uri.split(':')
                 port = int(port)
             factory = RedisFactory(
-                uri, dbid, poolsize, isLazy, _handler, charset, password
+                uri, dbid, poolsize, isLazy, _handler, charset, password,
+                **options
             )
             factory.continueTrying = reconnect
-            args = (uri, factory) if _IS_UNIX else (host, port, factory)
-            for x in xrange(poolsize):
-                endpoint(*args)
+            address = (uri,) if _IS_UNIX else (host, port)
+            factory.setEndpoint(endpoint, *address)
+            for x in xrange(factory.poolsize):
+                factory.openConnection()
 
             if isLazy:
                 connections.append(factory.handler)
@@ -102,10 +147,10 @@ def connect(
                 connections.append(factory.deferred)
 
         if isLazy:
-            return wrapper(connections)
+            return wrapper(connections, weights=weights, placement=placement)
         else:
             deferred = defer.DeferredList(connections)
-            wrapper(deferred)
+            wrapper(deferred, weights=weights, placement=placement)
             return deferred
 
 
@@ -0,0 +1,78 @@
+"""
+Connection selection strategies used by RedisFactory to decide which pooled
+connection gets the next command.
+
+A strategy is any object with a ``select(connections)`` method which returns
+one of the (non-empty) list of connections it is given. The connections are
+RedisProtocol instances, whose ``outstanding`` and ``latency`` attributes
+describe how busy and how slow each of them currently is.
+"""
+
+
+class RoundRobinStrategy(object):
+    """
+    Hand out connections in turn, regardless of their load.
+    """
+    def __init__(self):
+        self.idx = 0
+
+    def select(self, connections):
+        self.idx = (self.idx + 1) % len(connections)
+        return connections[self.idx]
+
+
+class LeastOutstandingStrategy(object):
+    """
+    Pick the connection with the fewest commands awaiting a reply.
+    """
+    def select(self, connections):
+        return min(connections, key=_outstanding)
+
+
+class LatencyStrategy(object):
+    """
+    Pick the connection with the lowest expected wait: the moving average of
+    its reply latency weighted by the number of commands ahead in its queue.
+    Connections without any latency samples yet are preferred, least
+    outstanding first.
+    """
+    def select(self, connections):
+        return min(connections, key=_expected_wait)
+
+
+def _outstanding(conn):
+    return conn.outstanding
+
+
+def _expected_wait(conn):
+    return conn.latency * (conn.outstanding + 1), conn.outstanding
+
+
+STRATEGIES = {
+    'round-robin': RoundRobinStrategy,
+    'least-outstanding': LeastOutstandingStrategy,
+    'latency': LatencyStrategy,
+}
+
+
+def get_strategy(strategy):
+    """
+    Return a strategy instance for ``strategy``, which is either one of the
+    names in STRATEGIES, an object with a ``select`` method or None for the
+    default (least outstanding).
+    """
+    if strategy is None:
+        return LeastOutstandingStrategy()
+    if isinstance(strategy, basestring):
+        try:
+            return STRATEGIES[strategy.lower()]()
+        except KeyError:
+            raise ValueError(
+                "Unknown connection selection strategy %s" % repr(strategy)
+            )
+    if not callable(getattr(strategy, 'select', None)):
+        raise ValueError(
+            "Connection selection strategy %s has no select() method" %
+            repr(strategy)
+        )
+    return strategy
@@ -0,0 +1,95 @@
+import heapq
+import itertools
+
+from twisted.internet import reactor
+from twisted.python import log
+
+
+class TimerHeap(object):
+    """
+    Many deadlines served by a single reactor.callLater.
+
+    Timers are kept in a heap ordered by deadline and only the earliest one
+    is scheduled with the reactor. Cancelling a timer only marks it; the
+    heap is compacted when most of it is made of cancelled timers, which is
+    the common case for command timeouts where replies beat their deadline.
+    """
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self, clock=reactor):
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._cancelled = 0
+        self._call = None
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def seconds(self):
+        return self.clock.seconds()
+
+    def add(self, deadline, f, *args):
+        """
+        Call f(*args) once the clock reaches deadline. Returns a timer which
+        can be passed to cancel().
+        """
+        timer = [deadline, next(self._seq), f, args]
+        heapq.heappush(self._heap, timer)
+        if self._heap[0] is timer:
+            self._schedule()
+        return timer
+
+    def cancel(self, timer):
+        if timer[2] is None:
+            return
+        timer[2] = timer[3] = None
+        self._cancelled += 1
+        if self._cancelled == len(self._heap):
+            self.clear()
+        elif self._cancelled > self.COMPACT_THRESHOLD and \
+                self._cancelled * 2 > len(self._heap):
+            self._heap = [t for t in self._heap if t[2] is not None]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def clear(self):
+        """
+        Forget every timer, without calling any of them.
+        """
+        for timer in self._heap:
+            timer[2] = timer[3] = None
+        self._heap = []
+        self._cancelled = 0
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+
+    def _schedule(self):
+        delay = max(self._heap[0][0] - self.clock.seconds(), 0)
+        if self._call is None:
+            self._call = self.clock.callLater(delay, self._expire)
+        else:
+            self._call.reset(delay)
+
+    def _expire(self):
+        self._call = None
+        now = self.clock.seconds()
+        # the callbacks may add, cancel or clear timers as they run
+        while self._heap and self._heap[0][0] <= now:
+            timer = heapq.heappop(self._heap)
+            f, args = timer[2], timer[3]
+            if f is None:
+                self._cancelled -= 1
+                continue
+            timer[2] = timer[3] = None
+            # a failing callback must not hold back the other timers
+            try:
+                f(*args)
+            except Exception:
+                log.err(None, "Timer callback %r failed" % (f,))
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        if self._heap and self._call is None:
+            self._schedule()